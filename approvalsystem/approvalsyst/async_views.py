@@ -0,0 +1,153 @@
+# async_views.py
+# Async versions of the hottest endpoints, for ASGI deployments
+# (uvicorn approvalsystem.asgi:application). Same bodies as their DRF
+# counterparts:
+#
+#   GET   /api/async/requests/pending/
+#   GET   /api/async/requests/<id>/
+#   GET   /api/async/finance/requests/
+#   PATCH /api/async/uploads/<id>/          chunk upload, protocol in uploads.py
+#
+# Queries go through the async ORM and chunk writes run in a worker thread, so
+# a connection waiting on the database, the disk or a slow client doesn't pin
+# one of the server's threads. Under WSGI keep using the regular endpoints.
+import functools
+
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, PermissionDenied
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import ForcedAuthentication, Request
+from rest_framework.settings import api_settings
+
+from . import uploads
+from .authentication import aget_token
+from .conditional import adetail_validators, alist_etag, not_modified, set_validators
+from .db_routing import read_alias_for
+from .models import PurchaseRequest, UploadSession
+from .permissions import aget_user_groups, user_has_role
+from .serializers import PurchaseRequestSerializer
+from .views import approved_requests, pending_requests, visible_requests
+
+
+def _json(data, status=200, headers=None):
+    return HttpResponse(JSONRenderer().render(data), status=status, headers=headers, content_type='application/json')
+
+
+async def _authenticate(request):
+    # TokenAuthentication, then the session, like the DRF views
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword.lower() == 'token':
+        token = await aget_token(key.strip())
+        if token is None or not token.user.is_active:
+            raise NotAuthenticated("Invalid token.")
+        return token.user
+    user = await request.auser()
+    if not user.is_authenticated:
+        raise NotAuthenticated()
+    if request.method not in SAFE_METHODS:
+        SessionAuthentication().enforce_csrf(request)
+    return user
+
+
+def async_api(view):
+    """
+    Authenticates, loads the user's groups and turns DRF exceptions into JSON
+    errors; the view gets the user as its second argument.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            user = await _authenticate(request)
+            await aget_user_groups(user)
+            request.user = user
+            return await view(request, user, *args, **kwargs)
+        except APIException as exc:
+            return _json({'detail': exc.detail}, status=exc.status_code)
+    # CSRF is checked in _authenticate for session users only
+    return csrf_exempt(wrapper)
+
+
+def _drf_request(request, user):
+    # for the paginator and serializer context; authentication is already done
+    return Request(request, authenticators=(ForcedAuthentication(user, None),))
+
+
+def _reading(request, user, queryset):
+    alias = read_alias_for(request, user)
+    return queryset.using(alias) if alias else queryset
+
+
+async def _list(request, user, queryset):
+    etag = await alist_etag(request, queryset)
+    response = not_modified(request, etag)
+    if response is None:
+        drf_request = _drf_request(request, user)
+        paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+        page = await paginator.apaginate_queryset(queryset, drf_request)
+        data = PurchaseRequestSerializer(page, many=True, context={'request': drf_request}).data
+        response = set_validators(_json(paginator.get_paginated_data(data)), etag)
+    return response
+
+
+@require_GET
+@async_api
+async def pending(request, user):
+    if not user_has_role(user, 'approver'):
+        raise PermissionDenied()
+    # pending stays on the primary, like the sync endpoint
+    queryset = pending_requests(user, visible_requests(user, PurchaseRequest.objects.prefetch_related('items')))
+    return await _list(request, user, queryset)
+
+
+@require_GET
+@async_api
+async def request_detail(request, user, pk):
+    queryset = _reading(request, user, visible_requests(user, PurchaseRequest.objects.prefetch_related('items')))
+    validators = await adetail_validators(request, queryset, pk)
+    if validators is None:
+        raise NotFound()
+    etag, last_modified = validators
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        pr = await queryset.filter(pk=pk).afirst()
+        if pr is None:
+            raise NotFound()
+        data = PurchaseRequestSerializer(pr, context={'request': _drf_request(request, user)}).data
+        response = set_validators(_json(data), etag, last_modified)
+    return response
+
+
+@require_GET
+@async_api
+async def finance_requests(request, user):
+    if not user_has_role(user, 'finance'):
+        raise PermissionDenied()
+    return await _list(request, user, _reading(request, user, approved_requests()))
+
+
+@require_http_methods(['PATCH'])
+@async_api
+async def upload_chunk(request, user, session_id):
+    session = await UploadSession.objects.select_related('purchase_request', 'created_by').filter(
+        pk=session_id, created_by=user,
+    ).afirst()
+    if session is None:
+        raise NotFound()
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.GET.get('offset')))
+    except (TypeError, ValueError):
+        return _json({"detail": "Send the chunk's position in an Upload-Offset header."}, status=400)
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    try:
+        offset = await uploads.awrite_chunk(session, offset, request, length)
+    except uploads.UploadError as exc:
+        data, headers = {'detail': str(exc)}, {}
+        if exc.offset is not None:
+            data['offset'] = exc.offset
+            headers['Upload-Offset'] = str(exc.offset)
+        return _json(data, status=exc.status, headers=headers)
+    return _json({'id': session.pk, 'offset': offset, 'size': session.size}, headers={'Upload-Offset': str(offset)})
@@ -0,0 +1,91 @@
+# authentication.py
+# Token authentication without the token+user query on every request. The
+# looked-up token (with its user) is cached for TOKEN_CACHE_TTL seconds;
+# signals.py drops the entry when the token is deleted or its user is saved
+# (deactivated, password changed, ...). Group names come from the role cache
+# in permissions.py. Use a shared cache backend so invalidation reaches every
+# worker process.
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def stats():
+    with _stats_lock:
+        out = dict(_stats)
+    lookups = out['hits'] + out['misses']
+    out['hit_rate'] = out['hits'] / lookups if lookups else 0.0
+    return out
+
+
+def _token_cache_key(key):
+    # the raw key never ends up in the cache backend
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()[:40]
+
+
+def _ttl():
+    return getattr(settings, 'TOKEN_CACHE_TTL', 60)
+
+
+def get_token(key):
+    """
+    The Token for `key` with its user loaded, or None.
+    """
+    cache_key = _token_cache_key(key)
+    token = cache.get(cache_key)
+    if token is not None:
+        _count('hits')
+        return token
+    _count('misses')
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is not None:
+        cache.set(cache_key, token, _ttl())
+    return token
+
+
+async def aget_token(key):
+    cache_key = _token_cache_key(key)
+    token = await cache.aget(cache_key)
+    if token is not None:
+        _count('hits')
+        return token
+    _count('misses')
+    token = await Token.objects.select_related('user').filter(key=key).afirst()
+    if token is not None:
+        await cache.aset(cache_key, token, _ttl())
+    return token
+
+
+def invalidate_tokens(*keys):
+    if keys:
+        cache.delete_many([_token_cache_key(key) for key in keys])
+        _count('invalidations', len(keys))
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(*Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        token = get_token(key)
+        if token is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return (token.user, token)
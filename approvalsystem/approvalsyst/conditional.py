@@ -0,0 +1,113 @@
+# conditional.py
+# ETag / Last-Modified for the request endpoints, computed from updated_at
+# before anything is serialized so a matching If-None-Match costs one small
+# query. Every write path (save, bulk_update, item edits via the serializer)
+# bumps PurchaseRequest.updated_at.
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+# bump when the serialized representation changes shape
+REPRESENTATION_VERSION = 1
+
+
+def _etag(*parts):
+    raw = '|'.join(str(part) for part in (REPRESENTATION_VERSION,) + parts)
+    return quote_etag(hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+def list_etag(request, queryset):
+    """
+    ETag for a list from max(updated_at) and count over the whole filtered
+    queryset (count catches deletes). The query string is part of it, so each
+    page/cursor has its own tag. No Last-Modified: a delete doesn't move it.
+    """
+    stamp = queryset.order_by().aggregate(last=Max('updated_at'), count=Count('id'))
+    last = stamp['last'].isoformat() if stamp['last'] else ''
+    return _etag('list', request.user.pk, request.get_full_path(), last, stamp['count'])
+
+
+async def alist_etag(request, queryset):
+    stamp = await queryset.order_by().aaggregate(last=Max('updated_at'), count=Count('id'))
+    last = stamp['last'].isoformat() if stamp['last'] else ''
+    return _etag('list', request.user.pk, request.get_full_path(), last, stamp['count'])
+
+
+def detail_validators(request, queryset, pk):
+    """
+    (etag, last_modified) for one row, or None when it isn't in the queryset
+    (the normal 404 path handles that).
+    """
+    try:
+        updated_at = queryset.filter(pk=pk).order_by().values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+    if updated_at is None:
+        return None
+    return _etag('detail', request.user.pk, pk, updated_at.isoformat()), updated_at
+
+
+async def adetail_validators(request, queryset, pk):
+    try:
+        updated_at = await queryset.filter(pk=pk).order_by().values_list('updated_at', flat=True).afirst()
+    except (TypeError, ValueError):
+        return None
+    if updated_at is None:
+        return None
+    return _etag('detail', request.user.pk, pk, updated_at.isoformat()), updated_at
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    The 304 (or 412) response when the client's validators still match,
+    otherwise None.
+    """
+    response = get_conditional_response(
+        getattr(request, '_request', request),
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # the body depends on who is asking
+    patch_vary_headers(response, ('Authorization', 'Cookie'))
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    list/retrieve answer If-None-Match / If-Modified-Since with a 304 before
+    the page is fetched or serialized.
+    """
+
+    def conditional_list(self, request, queryset, respond):
+        etag = list_etag(request, queryset)
+        response = not_modified(request, etag)
+        if response is None:
+            response = set_validators(respond(), etag)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        respond = super().list
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_list(request, queryset, lambda: respond(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        validators = detail_validators(request, self.filter_queryset(self.get_queryset()), lookup)
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = validators
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+        return response
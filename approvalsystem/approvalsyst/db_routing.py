@@ -0,0 +1,105 @@
+# db_routing.py
+# Read replica routing. Views opt in with ReplicaReadMixin: the actions listed
+# in replica_actions read from settings.READ_REPLICA_ALIAS for the rest of the
+# request. Writes always go to the primary, and a user who just wrote keeps
+# reading the primary for REPLICA_STICKY_SECONDS so they see their own change
+# while the replica catches up.
+import contextvars
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+# alias for reads that carry no instance hint; None leaves them on the primary
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def replica_alias():
+    return getattr(settings, 'READ_REPLICA_ALIAS', None)
+
+
+def _sticky_key(user_id):
+    return f'db-sticky:{user_id}'
+
+
+def mark_sticky(user):
+    cache.set(_sticky_key(user.pk), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+def is_sticky(user):
+    return user.is_authenticated and cache.get(_sticky_key(user.pk)) is not None
+
+
+def read_alias_for(request, user):
+    # where a replica-eligible read should go; None means the primary
+    alias = replica_alias()
+    if alias and request.method in SAFE_METHODS and not is_sticky(user):
+        return alias
+    return None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        # related lookups stay on the database their instance came from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # also for rows that were read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Safe-method actions in replica_actions read from the replica, unless the
+    user has written recently.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = read_alias_for(request, request.user) if self.action in self.replica_actions else None
+        if alias:
+            self._replica_token = _read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def _record_write(request, response):
+    # DRF copies the authenticated user (token or session) onto the request
+    user = getattr(request, 'user', None)
+    if (
+        replica_alias() and request.method not in SAFE_METHODS and response.status_code < 400
+        and user is not None and user.is_authenticated
+    ):
+        mark_sticky(user)
+
+
+@sync_and_async_middleware
+def replica_stickiness_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            _record_write(request, response)
+            return response
+    else:
+        def middleware(request):
+            response = get_response(request)
+            _record_write(request, response)
+            return response
+    return middleware
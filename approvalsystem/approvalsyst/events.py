@@ -0,0 +1,185 @@
+# events.py
+# Push notifications for approver inboxes. Write paths record which level
+# queues a request entered or left (InboxChanges, used like SummaryDelta) and
+# publish after commit on channel "inbox:<level>". The SSE view subscribes to
+# its approver's level, so an idle client holds a queue, not a DB query.
+#
+# LocalBroadcaster only reaches clients connected to this process. It has the
+# publish/subscribe shape of Redis pub/sub so a Redis-backed class can replace
+# it (INBOX_BROADCASTER) when the app runs on more than one process.
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import PurchaseRequest
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {'type': 'resync'}
+
+
+class _Subscriber:
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def deliver(self, message):
+        # runs on the subscriber's loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # too far behind: drop the backlog and tell the client to refetch
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        message = await self.queue.get()
+        if message is RESYNC:
+            self.overflowed = False
+        return message
+
+
+class _Subscription:
+    # a plain class rather than @asynccontextmanager: the SSE body is itself an
+    # async generator, and a nested one can be finalized out of order on close
+
+    def __init__(self, broadcaster, channel):
+        self.broadcaster = broadcaster
+        self.channel = channel
+        self.subscriber = None
+
+    async def __aenter__(self):
+        self.subscriber = _Subscriber(asyncio.get_running_loop(), self.broadcaster.queue_size)
+        self.broadcaster._add(self.channel, self.subscriber)
+        return self.subscriber
+
+    async def __aexit__(self, *exc_info):
+        self.broadcaster._discard(self.channel, self.subscriber)
+        return False
+
+
+class LocalBroadcaster:
+    """
+    In-process pub/sub. publish() may be called from any thread; messages are
+    handed to each subscriber's event loop.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, message)
+            except RuntimeError:
+                # loop already closed, the subscription is going away
+                pass
+        return len(subscribers)
+
+    def subscribe(self, channel):
+        """
+        `async with broadcaster.subscribe(channel) as subscription:` then
+        `await subscription.get()`.
+        """
+        return _Subscription(self, channel)
+
+    def _add(self, channel, subscriber):
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscriber)
+
+    def _discard(self, channel, subscriber):
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            path = getattr(settings, 'INBOX_BROADCASTER', 'approvalsystem.approvalsyst.events.LocalBroadcaster')
+            _broadcaster = import_string(path)()
+    return _broadcaster
+
+
+def inbox_channel(level):
+    return f'inbox:{level}'
+
+
+def waiting_levels(pr):
+    # the levels whose pending list shows this request
+    if pr.status != PurchaseRequest.STATUS_PENDING:
+        return set()
+    try:
+        levels = pr.effective_approval_levels()
+    except ValidationError:
+        # levels stored before they were validated; a notification is not worth failing the write
+        logger.warning("Request %s has invalid approval levels %r", pr.pk, pr.required_approval_levels)
+        return set()
+    return {level for level in levels if not pr.has_level_approved(level)}
+
+
+class InboxChanges:
+    """
+    remove(pr) before a change, add(pr) after it, publish() inside the
+    transaction; messages go out once it commits.
+    """
+
+    def __init__(self):
+        self.before = {}
+        self.after = {}
+
+    def remove(self, pr):
+        self.before[pr.pk] = waiting_levels(pr)
+
+    def add(self, pr):
+        self.after[pr.pk] = waiting_levels(pr)
+
+    def messages(self):
+        out = []
+        for pk in self.before.keys() | self.after.keys():
+            before, after = self.before.get(pk, set()), self.after.get(pk, set())
+            out += [(level, {'type': 'entered', 'request_id': pk, 'level': level}) for level in sorted(after - before)]
+            out += [(level, {'type': 'left', 'request_id': pk, 'level': level}) for level in sorted(before - after)]
+        return out
+
+    def publish(self):
+        messages = self.messages()
+        self.before, self.after = {}, {}
+        if not messages:
+            return
+
+        def send():
+            broadcaster = get_broadcaster()
+            for level, message in messages:
+                broadcaster.publish(inbox_channel(level), message)
+
+        transaction.on_commit(send)
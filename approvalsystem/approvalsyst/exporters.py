@@ -0,0 +1,81 @@
+# exporters.py
+# Streaming CSV / NDJSON export of purchase requests. Rows are read with
+# QuerySet.iterator(chunk_size), which also prefetches items per chunk, and
+# written out as they are produced, so memory does not grow with the result.
+import csv
+import json
+
+from django.conf import settings
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUMNS = (
+    'id', 'title', 'description', 'amount', 'status', 'created_by', 'last_approved_by',
+    'created_at', 'updated_at', 'required_approval_levels', 'vendor_name', 'po_reference', 'items',
+)
+
+
+class _Echo:
+    # csv.writer wants a file; hand back each formatted line instead
+    def write(self, value):
+        return value
+
+
+def export_queryset(queryset):
+    return (
+        queryset.select_related('created_by', 'last_approved_by', 'po')
+        .prefetch_related('items')
+        .order_by('created_at', 'id')
+    )
+
+
+def _record(pr):
+    po = getattr(pr, 'po', None)
+    return {
+        'id': pr.pk,
+        'title': pr.title,
+        'description': pr.description,
+        'amount': str(pr.amount),
+        'status': pr.status,
+        'created_by': pr.created_by.username,
+        'last_approved_by': pr.last_approved_by.username if pr.last_approved_by else None,
+        'created_at': pr.created_at.isoformat(),
+        'updated_at': pr.updated_at.isoformat(),
+        'required_approval_levels': pr.effective_approval_levels(),
+        'vendor_name': po.vendor_name if po else None,
+        'po_reference': po.reference if po else None,
+        'items': [
+            {'name': item.name, 'qty': item.qty, 'unit_price': str(item.unit_price)}
+            for item in pr.items.all()
+        ],
+    }
+
+
+def _rows(queryset, chunk_size):
+    return (_record(pr) for pr in export_queryset(queryset).iterator(chunk_size=chunk_size))
+
+
+def iter_csv(queryset, chunk_size=None):
+    # same column layout the importer reads: levels as "1;2", items as JSON
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 1000)
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for record in _rows(queryset, chunk_size):
+        record['required_approval_levels'] = ';'.join(str(level) for level in record['required_approval_levels'])
+        record['items'] = json.dumps(record['items'])
+        yield writer.writerow(['' if record[column] is None else record[column] for column in COLUMNS])
+
+
+def iter_ndjson(queryset, chunk_size=None):
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 1000)
+    for record in _rows(queryset, chunk_size):
+        yield json.dumps(record) + '\n'
+
+
+def stream(queryset, fmt, chunk_size=None):
+    if fmt == 'csv':
+        return iter_csv(queryset, chunk_size)
+    return iter_ndjson(queryset, chunk_size)
@@ -0,0 +1,81 @@
+# extraction_cache.py
+# Extraction results keyed by (sha256 of the file, EXTRACTOR_VERSION). Bumping
+# EXTRACTOR_VERSION in utils.py invalidates everything parsed by older code.
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ExtractionCache
+from .utils import EXTRACTOR_VERSION
+
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def lookup(content_hash):
+    if not content_hash:
+        return None
+    entry = ExtractionCache.objects.filter(content_hash=content_hash, extractor_version=EXTRACTOR_VERSION).first()
+    if entry is None:
+        _count('misses')
+        return None
+    _count('hits')
+    ExtractionCache.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return {'vendor': entry.vendor_name, 'items': entry.items, 'total': entry.total_amount}
+
+
+def store(content_hash, data):
+    if not content_hash:
+        return
+    try:
+        with transaction.atomic():
+            ExtractionCache.objects.create(
+                content_hash=content_hash,
+                extractor_version=EXTRACTOR_VERSION,
+                vendor_name=data.get('vendor'),
+                items=data.get('items') or [],
+                total_amount=data.get('total') or 0,
+            )
+    except IntegrityError:
+        # a concurrent job extracted the same file first
+        return
+    _count('stores')
+    prune_every = getattr(settings, 'EXTRACTION_CACHE_PRUNE_EVERY', 100)
+    if stats()['stores'] % prune_every == 0:
+        prune()
+
+
+def prune():
+    """
+    Drop entries not used within EXTRACTION_CACHE_MAX_AGE_DAYS, results from
+    older extractor versions, and the least recently used entries beyond
+    EXTRACTION_CACHE_MAX_ENTRIES.
+    """
+    max_age = getattr(settings, 'EXTRACTION_CACHE_MAX_AGE_DAYS', 90)
+    max_entries = getattr(settings, 'EXTRACTION_CACHE_MAX_ENTRIES', 5000)
+
+    cutoff = timezone.now() - timedelta(days=max_age)
+    deleted, _ = ExtractionCache.objects.filter(last_used_at__lt=cutoff).delete()
+    deleted += ExtractionCache.objects.exclude(extractor_version=EXTRACTOR_VERSION).delete()[0]
+
+    overflow = ExtractionCache.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:]
+    overflow_ids = list(overflow)
+    if overflow_ids:
+        deleted += ExtractionCache.objects.filter(pk__in=overflow_ids).delete()[0]
+
+    _count('evictions', deleted)
+    return deleted
@@ -0,0 +1,173 @@
+# jobs.py
+# Background proforma extraction. The ExtractionJob table is the queue: uploads
+# insert a QUEUED row and return straight away, then either the in-process
+# worker pool or `manage.py run_extraction_worker` claims and runs it.
+# Swap dispatch() for a Celery task once Redis is wired up.
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import extraction_cache, metrics
+from .models import ExtractionJob, Proforma, PurchaseRequest, PurchaseOrder
+from .summaries import SummaryDelta
+from .events import InboxChanges
+from .utils import extract_pdf_data
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    workers = getattr(settings, 'EXTRACTION_WORKERS', 2)
+    if workers <= 0:
+        # jobs stay queued until a run_extraction_worker process picks them up
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extraction')
+    return _executor
+
+
+def enqueue_extraction(proforma, user):
+    job = ExtractionJob.objects.create(proforma=proforma, created_by=user)
+    # only hand the job to a worker once the proforma row is visible to it
+    transaction.on_commit(lambda: dispatch(job.pk))
+    return job
+
+
+def submit_proforma(file, content_hash, user):
+    """
+    Store an uploaded proforma and queue its extraction. Returns the job.
+    """
+    with transaction.atomic():
+        proforma = Proforma.objects.create(file=file, content_hash=content_hash, created_by=user)
+        return enqueue_extraction(proforma, user)
+
+
+def dispatch(job_id):
+    executor = _get_executor()
+    if executor is not None:
+        executor.submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # worker threads get their own connections, don't leak them
+        connections.close_all()
+
+
+def claim_job(job_id):
+    # the status check makes the claim atomic between pool threads and worker processes
+    return ExtractionJob.objects.filter(pk=job_id, status=ExtractionJob.STATUS_QUEUED).update(
+        status=ExtractionJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    ) == 1
+
+
+def claim_next_job():
+    queued = ExtractionJob.objects.filter(status=ExtractionJob.STATUS_QUEUED).order_by('created_at')
+    for job_id in queued.values_list('pk', flat=True)[:10]:
+        if claim_job(job_id):
+            return job_id
+    return None
+
+
+def requeue_stale_jobs(older_than):
+    # a worker died mid-job: put it back in the queue
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return ExtractionJob.objects.filter(
+        status=ExtractionJob.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(status=ExtractionJob.STATUS_QUEUED)
+
+
+def run_job(job_id):
+    if claim_job(job_id):
+        process_job(job_id)
+
+
+def _fail(job, exc):
+    job.status = ExtractionJob.STATUS_FAILED
+    job.error = f"{type(exc).__name__}: {exc}"
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def process_job(job_id):
+    """
+    Run extraction for a claimed job and create the request + PO from the result.
+    Any error marks the job FAILED, so a claimed job never stays RUNNING.
+    """
+    job = ExtractionJob.objects.select_related('proforma', 'created_by').get(pk=job_id)
+    proforma = job.proforma
+    start = time.perf_counter()
+    outcome = 'cached'
+    try:
+        data = extraction_cache.lookup(proforma.content_hash)
+        if data is None:
+            outcome = 'extracted'
+            data = extract_pdf_data(proforma.file.path)
+            extraction_cache.store(proforma.content_hash, data)
+    except Exception as exc:
+        metrics.observe('extraction', time.perf_counter() - start, 'error')
+        return _fail(job, exc)
+
+    metrics.observe('extraction', time.perf_counter() - start, outcome)
+    try:
+        _create_request(job, data)
+    except Exception as exc:
+        # e.g. an extracted total the amount column can't hold
+        return _fail(job, exc)
+    return job
+
+
+def _create_request(job, data):
+    proforma, user = job.proforma, job.created_by
+    total = data.get('total')
+    if total is not None:
+        # extraction returns a float; go through str so 9.1 stays 9.10
+        total = Decimal(str(total)).quantize(Decimal('0.01'))
+    with transaction.atomic():
+        proforma.vendor_name = data.get('vendor')
+        proforma.items = data.get('items')
+        proforma.total_amount = total
+        proforma.save(update_fields=['vendor_name', 'items', 'total_amount'])
+
+        purchase_request = PurchaseRequest.objects.create(
+            title=f"Request from {user.username}",
+            description=f"Generated from proforma {proforma.file.name}",
+            created_by=user,
+            status=PurchaseRequest.STATUS_PENDING,
+            amount=proforma.total_amount,
+            proforma=proforma,
+        )
+        PurchaseOrder.objects.create(
+            purchase_request=purchase_request,
+            proforma=proforma,
+            vendor_name=proforma.vendor_name or '',
+            items=json.dumps(proforma.items or [], default=str),
+            total_amount=proforma.total_amount,
+        )
+
+        job.status = ExtractionJob.STATUS_DONE
+        job.error = ''
+        job.purchase_request = purchase_request
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'purchase_request', 'finished_at'])
+        summary, inbox = SummaryDelta(), InboxChanges()
+        summary.add(purchase_request)
+        inbox.add(purchase_request)
+        inbox.publish()
+        summary.apply()
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import platform
+import statistics
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+# sync endpoint, async twin
+ENDPOINTS = {
+    'pending': ('/api/requests/pending/', '/api/async/requests/pending/'),
+    'finance': ('/api/finance/requests/', '/api/async/finance/requests/'),
+}
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def _percentiles(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(latencies, n=100)
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare a sync (WSGI) endpoint with its async (ASGI) twin at increasing concurrency, "
+        "in-process against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Username to call the endpoints as (needs the endpoint's role).")
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='pending')
+        parser.add_argument('--concurrency', type=_int_list, default=[1, 8, 32, 128], help="Comma separated client counts.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per concurrency level and path.")
+        parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads; the sync path serves at most this many at once.")
+        parser.add_argument('--db-latency', type=float, default=0.0, help="Milliseconds added to every query, to stand in for a database across the network.")
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+        token, _ = Token.objects.get_or_create(user=user)
+        sync_url, async_url = ENDPOINTS[options['endpoint']]
+        headers = {'Authorization': f'Token {token.key}'}
+
+        delay = options['db_latency'] / 1000
+
+        def slow_execute(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_execute)
+
+        if delay:
+            connection_created.connect(add_latency)
+            connection.execute_wrappers.append(slow_execute)
+        results = []
+        # the in-process clients send Host: testserver, as under the test runner
+        hosts = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+        hosts.enable()
+        try:
+            for concurrency in options['concurrency']:
+                for path, run in (('wsgi', self._run_sync), ('asgi', self._run_async)):
+                    url = sync_url if path == 'wsgi' else async_url
+                    result = run(url, headers, concurrency, options['requests'], options['threads'])
+                    result.update(path=path, url=url, concurrency=concurrency)
+                    results.append(result)
+                    self._print_result(result)
+        finally:
+            hosts.disable()
+            if delay:
+                connection_created.disconnect(add_latency)
+                connection.execute_wrappers.remove(slow_execute)
+
+        report = {
+            'endpoint': options['endpoint'],
+            'threads': options['threads'],
+            'db_latency_ms': options['db_latency'],
+            'python': platform.python_version(),
+            'generated_at': timezone.now().isoformat(),
+            'results': results,
+        }
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def _run_sync(self, url, headers, concurrency, total, threads):
+        # one thread per client; the semaphore is the server's worker pool
+        workers = threading.BoundedSemaphore(threads)
+        remaining = iter(range(total))
+        lock = threading.Lock()
+        latencies, errors = [], []
+
+        def client_loop():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    start = time.perf_counter()
+                    with workers:
+                        response = client.get(url, headers=headers)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        if response.status_code != 200:
+                            errors.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        clients = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return self._summary(latencies, errors, time.perf_counter() - start)
+
+    def _run_async(self, url, headers, concurrency, total, threads):
+        latencies, errors = [], []
+
+        async def main():
+            remaining = iter(range(total))
+
+            async def client_loop():
+                client = AsyncClient()
+                while next(remaining, None) is not None:
+                    start = time.perf_counter()
+                    # as ASGIHandler does per request: sync ORM work gets its own thread
+                    async with ThreadSensitiveContext():
+                        response = await client.get(url, headers=headers)
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+
+            await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+
+        start = time.perf_counter()
+        asyncio.run(main())
+        return self._summary(latencies, errors, time.perf_counter() - start)
+
+    def _summary(self, latencies, errors, seconds):
+        p50, p95, p99 = _percentiles(latencies)
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'error_statuses': sorted(set(errors)),
+            'seconds': round(seconds, 3),
+            'requests_per_second': round(len(latencies) / seconds, 1) if seconds else None,
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+        }
+
+    def _print_result(self, result):
+        self.stdout.write(
+            f"{result['path']} c={result['concurrency']:<4} {result['requests_per_second']:>8} req/s  "
+            f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms  errors={result['errors']}"
+        )
@@ -0,0 +1,166 @@
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import pypdfium2 as pdfium
+import pytesseract
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from approvalsystem.approvalsyst.pdfgen import LINES_PER_PAGE, render_text_pdf
+from approvalsystem.approvalsyst.utils import EXTRACTOR_VERSION, extract_pdf_data
+
+STAGES = ('open', 'text', 'render', 'ocr', 'parse')
+
+
+def _max_rss_bytes(children=False):
+    # high-water mark so far, not per case; pdfium's C allocations count here,
+    # and the children figure covers OCR workers once they have exited
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def synthetic_pages(pages, lines):
+    # spread the item lines over `pages`, adding pages when they don't fit
+    pages = max(pages, -(-(lines + 2) // LINES_PER_PAGE))
+    per_page = -(-lines // pages)
+    items = [f"Widget-{n:05d} {n % 9 + 1} {(n % 50) * 3 + 0.75:,.2f}" for n in range(lines)]
+    out = []
+    for page in range(pages):
+        header = ['Vendor: Benchmark Supplies Ltd', f'Proforma invoice - page {page + 1}'] if page == 0 else []
+        out.append(header + items[page * per_page:(page + 1) * per_page])
+    return out
+
+
+def write_corpus_file(directory, kind, pages, lines):
+    path = Path(directory) / f'{kind}-p{pages}-l{lines}.pdf'
+    pdf_bytes = render_text_pdf(synthetic_pages(pages, lines))
+    if kind == 'text':
+        path.write_bytes(pdf_bytes)
+        return path
+    # image-only: rasterise the text version so there is no text layer left
+    doc = pdfium.PdfDocument(pdf_bytes)
+    try:
+        images = [page.render(scale=150 / 72).to_pil().convert('L') for page in doc]
+    finally:
+        doc.close()
+    images[0].save(path, 'PDF', save_all=True, append_images=images[1:], resolution=150)
+    return path
+
+
+class Command(BaseCommand):
+    help = "Benchmark extract_pdf_data on a synthetic proforma corpus and write a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=_int_list, default=[1, 5, 20], help="Comma separated page counts.")
+        parser.add_argument('--lines', type=_int_list, default=[20, 200], help="Comma separated item line counts.")
+        parser.add_argument('--kinds', default='text,image', help="text, image or both.")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+        parser.add_argument('--compare', help="Baseline JSON to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before a case counts as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        kinds = [k.strip() for k in options['kinds'].split(',') if k.strip()]
+        if 'image' in kinds:
+            try:
+                pytesseract.get_tesseract_version()
+            except pytesseract.TesseractNotFoundError:
+                self.stderr.write("tesseract is not installed, skipping image-only cases.")
+                kinds.remove('image')
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for kind in kinds:
+                for pages in options['pages']:
+                    for lines in options['lines']:
+                        path = write_corpus_file(directory, kind, pages, lines)
+                        result = self._run_case(path, kind, pages, lines, options['repeat'])
+                        results.append(result)
+                        self._print_case(result)
+
+        report = {
+            'extractor_version': EXTRACTOR_VERSION,
+            'python': platform.python_version(),
+            'generated_at': timezone.now().isoformat(),
+            'results': results,
+        }
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['compare']:
+            regressions = self._compare(report, json.loads(Path(options['compare']).read_text()), options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} case(s) regressed: {', '.join(regressions)}")
+
+    def _run_case(self, path, kind, pages, lines, repeat):
+        case = path.stem
+        walls, peaks = [], []
+        stages = {stage: [] for stage in STAGES}
+        items_found = None
+        for _ in range(repeat):
+            timings = {}
+            tracemalloc.start()
+            start = time.perf_counter()
+            data = extract_pdf_data(str(path), timings)
+            walls.append(time.perf_counter() - start)
+            # Python heap only: pdfium and tesseract allocate outside it, see max_rss_bytes
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            for stage in STAGES:
+                stages[stage].append(timings.get(stage, 0.0))
+            items_found = len(data['items'])
+        return {
+            'case': case,
+            'kind': kind,
+            'pages': pages,
+            'lines': lines,
+            'repeat': repeat,
+            'wall_s': statistics.median(walls),
+            'stages_s': {stage: statistics.median(values) for stage, values in stages.items()},
+            'python_heap_peak_bytes': max(peaks),
+            'max_rss_bytes': _max_rss_bytes(),
+            'children_max_rss_bytes': _max_rss_bytes(children=True),
+            'items_expected': lines,
+            'items_found': items_found,
+        }
+
+    def _print_case(self, result):
+        stages = ' '.join(f"{k}={v * 1000:.1f}ms" for k, v in result['stages_s'].items() if v)
+        self.stdout.write(
+            f"{result['case']:<22} {result['wall_s'] * 1000:9.1f}ms  heap={result['python_heap_peak_bytes'] / 1024:,.0f}KiB  "
+            f"rss={(result['max_rss_bytes'] or 0) / 2 ** 20:,.0f}MiB  "
+            f"items={result['items_found']}/{result['items_expected']}  {stages}"
+        )
+
+    def _compare(self, report, baseline, tolerance):
+        previous = {r['case']: r for r in baseline.get('results', [])}
+        regressions = []
+        self.stdout.write(f"Compared with extractor v{baseline.get('extractor_version')} ({baseline.get('generated_at')}):")
+        for result in report['results']:
+            old = previous.get(result['case'])
+            if old is None:
+                continue
+            ratio = result['wall_s'] / old['wall_s'] if old['wall_s'] else 1.0
+            flag = ''
+            if ratio > 1 + tolerance:
+                flag = '  REGRESSION'
+                regressions.append(result['case'])
+            self.stdout.write(f"  {result['case']:<22} {old['wall_s'] * 1000:9.1f}ms -> {result['wall_s'] * 1000:9.1f}ms  x{ratio:.2f}{flag}")
+        return regressions
@@ -0,0 +1,339 @@
+import json
+import platform
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from approvalsystem.approvalsyst import summaries
+from approvalsystem.approvalsyst.models import Approval, PurchaseRequest, RequestItem, RequiredApprovalLevel
+from approvalsystem.approvalsyst.pdfgen import render_text_pdf
+from approvalsystem.approvalsyst.permissions import APPROVER_GROUP_PREFIX
+
+# operation -> role of the user performing it
+OPERATIONS = {
+    'list': 'staff',
+    'pending': 'approver',
+    'reviewed': 'approver',
+    'approve': 'approver',
+    'reject': 'approver',
+    'finance': 'finance',
+    'upload': 'staff',
+}
+DEFAULT_MIX = 'list=3,pending=3,reviewed=1,approve=2,reject=1,finance=2,upload=1'
+
+
+def _mix(value):
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation {name!r}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def _percentiles(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(latencies, n=100)
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+class Dataset:
+    """
+    The seeded users (with tokens) by role, and per approval level the pending
+    requests still waiting for that level.
+    """
+
+    def __init__(self, prefix):
+        User = get_user_model()
+        self.users = defaultdict(list)
+        users = User.objects.filter(username__startswith=f'{prefix}-').prefetch_related('groups')
+        tokens = dict(Token.objects.filter(user__in=users).values_list('user_id', 'key'))
+        for user in users:
+            for group in user.groups.all():
+                role = 'approver' if group.name.startswith(APPROVER_GROUP_PREFIX) else group.name
+                level = int(group.name.rsplit('-', 1)[-1]) if role == 'approver' else None
+                self.users[role].append((tokens[user.pk], level))
+        self.waiting = defaultdict(list)
+        pending = PurchaseRequest.objects.filter(
+            created_by__in=users, status=PurchaseRequest.STATUS_PENDING,
+        ).only('pk', 'required_approval_levels', 'approved_levels_mask')
+        for pr in pending:
+            for level in pr.effective_approval_levels():
+                if not pr.has_level_approved(level):
+                    self.waiting[level].append(pr.pk)
+        for ids in self.waiting.values():
+            random.shuffle(ids)
+        self.closed = set()
+        self.lock = threading.Lock()
+
+    def take(self, level):
+        # a request for this level to act on; rejected ones leave every level's queue
+        with self.lock:
+            ids = self.waiting.get(level, [])
+            while ids:
+                pk = ids.pop()
+                if pk not in self.closed:
+                    return pk
+        return None
+
+    def close(self, pk):
+        with self.lock:
+            self.closed.add(pk)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and drive the real API routes with concurrent clients; "
+        "reports throughput, latency percentiles and queries per request as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='load', help="Username prefix of the seeded users.")
+        parser.add_argument('--users', type=int, default=30, help="Seeded users, split across staff, finance and approver levels.")
+        parser.add_argument('--requests', type=int, default=1000, help="Seeded purchase requests.")
+        parser.add_argument('--items', type=int, default=3, help="Items per seeded request.")
+        parser.add_argument('--no-seed', action='store_true', help="Reuse the users and requests of an earlier run.")
+        parser.add_argument('--clients', type=int, default=8, help="Concurrent clients.")
+        parser.add_argument('--operations', type=int, default=2000, help="Total requests to send.")
+        parser.add_argument('--mix', type=_mix, default=_mix(DEFAULT_MIX), help=f"Operation weights (default {DEFAULT_MIX}).")
+        parser.add_argument('--random-seed', type=int, default=1)
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the seeded users and their requests, then exit.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        random.seed(options['random_seed'])
+        if options['cleanup']:
+            self._cleanup(prefix)
+            return
+        if not options['no_seed']:
+            if get_user_model().objects.filter(username__startswith=f'{prefix}-').exists():
+                raise CommandError(f"Users named {prefix}-* already exist: pass --no-seed to reuse them or --cleanup first.")
+            started = time.perf_counter()
+            self._seed(prefix, options['users'], options['requests'], options['items'])
+            self.stdout.write(f"Seeded {options['users']} users and {options['requests']} requests in {time.perf_counter() - started:.1f}s.")
+
+        dataset = Dataset(prefix)
+        missing = {OPERATIONS[name] for name in options['mix']} - set(dataset.users)
+        if missing:
+            raise CommandError(f"No seeded users with role(s) {', '.join(sorted(missing))}.")
+
+        # the in-process clients send Host: testserver, as under the test runner
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            report = self._run(dataset, options)
+        report['dataset'] = {
+            'prefix': prefix,
+            'users': {role: len(users) for role, users in dataset.users.items()},
+            'requests': PurchaseRequest.objects.filter(created_by__username__startswith=f'{prefix}-').count(),
+        }
+        self._print_report(report)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def _seed(self, prefix, user_count, request_count, item_count):
+        User = get_user_model()
+        levels = sorted(getattr(settings, 'REQUIRED_APPROVAL_LEVELS', [1, 2]))
+        # half staff, a sixth finance, the rest approvers spread over the levels
+        staff = max(1, user_count // 2)
+        finance = max(1, user_count // 6)
+        approvers = max(len(levels), user_count - staff - finance)
+        roles = ['staff'] * staff + ['finance'] * finance + [
+            f'{APPROVER_GROUP_PREFIX}{levels[n % len(levels)]}' for n in range(approvers)
+        ]
+        password = make_password(prefix)
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=f'{prefix}-{role}-{n}', password=password) for n, role in enumerate(roles)
+            ])
+            groups = {name: Group.objects.get_or_create(name=name)[0] for name in set(roles)}
+            User.groups.through.objects.bulk_create([
+                User.groups.through(user_id=user.pk, group_id=groups[role].pk) for user, role in zip(users, roles)
+            ])
+            Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users])
+
+            owners = [user for user, role in zip(users, roles) if role == 'staff']
+            approvers_by_level = defaultdict(list)
+            for user, role in zip(users, roles):
+                if role.startswith(APPROVER_GROUP_PREFIX):
+                    approvers_by_level[int(role.rsplit('-', 1)[-1])].append(user)
+            all_levels_mask = sum(PurchaseRequest.level_bit(level) for level in levels)
+
+            # roughly: 40% untouched, 20% part way, 30% approved, 10% rejected
+            requests, histories = [], []
+            for n in range(request_count):
+                outcome = random.choices(('new', 'partial', 'approved', 'rejected'), weights=(4, 2, 3, 1))[0]
+                pr = PurchaseRequest(
+                    title=f'Load request {n}', amount=Decimal('0'), created_by=random.choice(owners),
+                    required_approval_levels=levels,
+                )
+                steps = []
+                if outcome == 'partial':
+                    steps = [(levels[0], Approval.APPROVED)]
+                elif outcome == 'approved':
+                    steps = [(level, Approval.APPROVED) for level in levels]
+                    pr.status = PurchaseRequest.STATUS_APPROVED
+                elif outcome == 'rejected':
+                    steps = [(levels[0], Approval.REJECTED)]
+                    pr.status = PurchaseRequest.STATUS_REJECTED
+                pr.approved_levels_mask = sum(
+                    PurchaseRequest.level_bit(level) for level, action in steps if action == Approval.APPROVED
+                ) & all_levels_mask
+                if steps:
+                    pr.last_approved_by = random.choice(approvers_by_level[steps[-1][0]])
+                requests.append(pr)
+                histories.append(steps)
+
+            items = []
+            for pr in requests:
+                lines = [(random.randint(1, 5), Decimal(random.randint(100, 50000)) / 100) for _ in range(item_count)]
+                pr.amount = sum((qty * price for qty, price in lines), Decimal('0'))
+                items.append(lines)
+            PurchaseRequest.objects.bulk_create(requests, batch_size=500)
+            RequestItem.objects.bulk_create([
+                RequestItem(request=pr, name=f'Item {i}', qty=qty, unit_price=price)
+                for pr, lines in zip(requests, items) for i, (qty, price) in enumerate(lines)
+            ], batch_size=1000)
+            # bulk_create skips post_save, so fill the inbox level table here
+            RequiredApprovalLevel.objects.bulk_create([
+                RequiredApprovalLevel(purchase_request=pr, level=level) for pr in requests for level in levels
+            ], batch_size=1000)
+            Approval.objects.bulk_create([
+                Approval(purchase_request=pr, approver=random.choice(approvers_by_level[level]), level=level, action=action)
+                for pr, steps in zip(requests, histories) for level, action in steps
+            ], batch_size=1000)
+        summaries.rebuild()
+
+    def _cleanup(self, prefix):
+        User = get_user_model()
+        users = User.objects.filter(username__startswith=f'{prefix}-')
+        with transaction.atomic():
+            deleted = PurchaseRequest.objects.filter(created_by__in=users).delete()[0]
+            Approval.objects.filter(approver__in=users).delete()
+            count = users.count()
+            users.delete()
+        summaries.rebuild()
+        self.stdout.write(f"Deleted {count} users and {deleted} rows.")
+
+    def _run(self, dataset, options):
+        names = list(options['mix'])
+        weights = [options['mix'][name] for name in names]
+        remaining = iter(range(options['operations']))
+        results = defaultdict(list)  # op -> [(seconds, status, queries)]
+        results_lock = threading.Lock()
+        upload_counter = iter(range(10 ** 9))
+
+        def send(client, op, rng):
+            token, level = rng.choice(dataset.users[OPERATIONS[op]])
+            headers = {'Authorization': f'Token {token}'}
+            if op in ('approve', 'reject'):
+                pk = dataset.take(level)
+                if pk is None:
+                    return None
+                response = client.patch(f'/api/requests/{pk}/{op}/', {}, content_type='application/json', headers=headers)
+                if op == 'reject' or response.status_code >= 400:
+                    dataset.close(pk)
+                return response
+            if op == 'upload':
+                pdf = render_text_pdf([[f'Vendor: Load Supplies {next(upload_counter)}', 'Widget 2 15.00']])
+                upload = SimpleUploadedFile('proforma.pdf', pdf, content_type='application/pdf')
+                return client.post('/api/proforma/upload/', {'file': upload}, headers=headers)
+            url = {
+                'list': '/api/requests/',
+                'pending': '/api/requests/pending/',
+                'reviewed': '/api/requests/reviewed/',
+                'finance': '/api/finance/requests/',
+            }[op]
+            return client.get(url, headers=headers)
+
+        def client_loop(number):
+            # server errors are counted, not raised
+            client = Client(raise_request_exception=False)
+            rng = random.Random(options['random_seed'] * 1000 + number)
+            queries = [0]
+
+            def count_query(execute, sql, params, many, context):
+                queries[0] += 1
+                return execute(sql, params, many, context)
+
+            try:
+                with connection.execute_wrapper(count_query):
+                    while next(remaining, None) is not None:
+                        op = rng.choices(names, weights)[0]
+                        queries[0] = 0
+                        start = time.perf_counter()
+                        response = send(client, op, rng)
+                        elapsed = time.perf_counter() - start
+                        if response is None:
+                            # nothing left to approve/reject at that level
+                            continue
+                        with results_lock:
+                            results[op].append((elapsed, response.status_code, queries[0]))
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        clients = [threading.Thread(target=client_loop, args=(n,)) for n in range(options['clients'])]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        endpoints = {op: self._summary(rows, seconds) for op, rows in sorted(results.items())}
+        overall = self._summary([row for rows in results.values() for row in rows], seconds)
+        return {
+            'clients': options['clients'],
+            'mix': options['mix'],
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'generated_at': timezone.now().isoformat(),
+            'seconds': round(seconds, 3),
+            'overall': overall,
+            'endpoints': endpoints,
+        }
+
+    def _summary(self, rows, seconds):
+        latencies = [row[0] for row in rows]
+        statuses = defaultdict(int)
+        for _, status, _ in rows:
+            statuses[str(status)] += 1
+        p50, p95, p99 = _percentiles(latencies)
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for _, status, _ in rows if status >= 400),
+            'statuses': dict(sorted(statuses.items())),
+            'requests_per_second': round(len(rows) / seconds, 1) if seconds else None,
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'queries_per_request': round(sum(row[2] for row in rows) / len(rows), 2) if rows else None,
+        }
+
+    def _print_report(self, report):
+        for name, result in [*report['endpoints'].items(), ('overall', report['overall'])]:
+            self.stdout.write(
+                f"{name:<9} {result['requests']:>6} req {result['requests_per_second']:>8}/s  "
+                f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms  "
+                f"queries={result['queries_per_request']}  errors={result['errors']}"
+            )
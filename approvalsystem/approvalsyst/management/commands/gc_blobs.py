@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from approvalsystem.approvalsyst.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Recount blob references from the file fields and delete unreferenced blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=getattr(settings, 'BLOB_GC_GRACE_SECONDS', 3600),
+                            help="Keep unreferenced blobs used within this many seconds.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        recounted, deleted = collect_garbage(options['grace'], dry_run=options['dry_run'])
+        for name in deleted:
+            self.stdout.write(f"{'would delete' if options['dry_run'] else 'deleted'} {name}")
+        self.stdout.write(f"Recounted {len(recounted)} blob(s), {len(deleted)} removed.")
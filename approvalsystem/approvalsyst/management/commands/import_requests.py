@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from approvalsystem.approvalsyst.importers import FORMATS, guess_format, import_requests
+
+
+class Command(BaseCommand):
+    help = "Bulk import purchase requests from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help="Username that will own the imported requests.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, help="Rows per transaction (default IMPORT_CHUNK_SIZE).")
+        parser.add_argument('--show-errors', type=int, default=20, help="How many row errors to print.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if fmt is None:
+            raise CommandError("Can't tell the file type from the name, pass --format.")
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+
+        with open(options['path'], 'rb') as stream:
+            report = import_requests(stream, fmt, user, chunk_size=options['chunk_size'])
+
+        for error in report['errors'][:options['show_errors']]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            f"Imported {report['imported']}, failed {report['failed']} "
+            f"in {report['seconds']}s ({report['rows_per_second']} rows/s)."
+        )
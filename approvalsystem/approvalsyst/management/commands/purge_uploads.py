@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from approvalsystem.approvalsyst.uploads import purge_stale
+
+
+class Command(BaseCommand):
+    help = "Abort resumable uploads that have been idle too long and delete their partial files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=24 * 3600, help="Idle seconds before an upload is purged.")
+
+    def handle(self, *args, **options):
+        purged = purge_stale(options['older_than'])
+        self.stdout.write(f"Purged {purged} upload(s).")
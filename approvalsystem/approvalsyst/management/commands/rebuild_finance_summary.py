@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from approvalsystem.approvalsyst.models import FinanceSummary
+from approvalsystem.approvalsyst.summaries import compute_rows, rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the finance summary rows from purchase requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only compare stored rows with a fresh computation.")
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = rebuild()
+            self.stdout.write(f"Rebuilt {len(rows)} summary row(s).")
+            return
+
+        expected = {(r.dimension, r.key): (r.request_count, r.total_amount) for r in compute_rows()}
+        stored = {
+            (r.dimension, r.key): (r.request_count, r.total_amount)
+            for r in FinanceSummary.objects.exclude(request_count=0, total_amount=0)
+        }
+        drift = sorted(key for key in expected.keys() | stored.keys() if expected.get(key) != stored.get(key))
+        for key in drift:
+            self.stdout.write(f"{key[0]}={key[1]!r}: stored {stored.get(key)} expected {expected.get(key)}")
+        if drift:
+            raise CommandError(f"{len(drift)} summary row(s) out of date, run rebuild_finance_summary.")
+        self.stdout.write("Summary rows are up to date.")
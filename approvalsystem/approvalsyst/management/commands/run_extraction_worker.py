@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from approvalsystem.approvalsyst.jobs import claim_next_job, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued proforma extraction jobs (stand-in for a Celery worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--stale-after', type=int, default=600, help="Requeue jobs running longer than this many seconds.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+
+        while True:
+            close_old_connections()
+            job_id = claim_next_job()
+            if job_id is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            job = process_job(job_id)
+            self.stdout.write(f"Job {job.pk}: {job.status}")
@@ -0,0 +1,38 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from approvalsystem.approvalsyst.po_documents import claim_batch, render_batch, requeue_stale
+
+
+class Command(BaseCommand):
+    help = "Render pending purchase order PDFs in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll', type=float, default=5.0, help="Seconds to sleep when nothing is pending.")
+        parser.add_argument('--stale-after', type=int, default=600, help="Requeue orders rendering longer than this many seconds.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale order(s).")
+
+        while True:
+            close_old_connections()
+            orders = claim_batch(options['batch_size'])
+            if not orders:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            start = time.perf_counter()
+            timings = render_batch(orders)
+            failed = sum(1 for po in orders if po.render_status == po.RENDER_FAILED)
+            self.stdout.write(
+                f"Rendered {len(orders) - failed}/{len(orders)} in {(time.perf_counter() - start) * 1000:.1f}ms "
+                f"(median {statistics.median(timings):.1f}ms, max {max(timings):.1f}ms per document)"
+            )
@@ -0,0 +1,259 @@
+# metrics.py
+# Per-route request metrics in the Prometheus text format, served on /metrics.
+#
+#   metrics_middleware   latency histogram per route/method/status; DB query
+#                        count and time, and serializer time, per route
+#   SerializerTimingMixin  times serializer .data for the current request
+#   observe()            any other duration (upload chunks, extraction, ...)
+#
+# Queries are counted by an execute wrapper on every connection that only
+# touches a context variable, so async views (whose queries run in worker
+# threads) are counted too. Cache and broadcaster stats are read at scrape time.
+import contextvars
+import json
+import logging
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_labels(self.label_names, labels)} {value}' for labels, value in values]
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.label_names + ('le',)
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency.', ('route', 'method', 'status'))
+DB_QUERIES = Counter('db_queries_total', 'Queries run while serving requests.', ('route',))
+DB_SECONDS = Counter('db_query_seconds_total', 'Time spent in queries while serving requests.', ('route',))
+QUERIES_PER_REQUEST = Histogram('db_queries_per_request', 'Queries per request.', ('route',), buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+SERIALIZER_SECONDS = Histogram('serializer_duration_seconds', 'Time spent producing serializer output per request.', ('route',))
+DURATIONS = Histogram('operation_duration_seconds', 'Background and upload work: upload chunks/commits, extraction, PO rendering.', ('operation', 'outcome'), buckets=DURATION_BUCKETS)
+
+REGISTRY = [REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, QUERIES_PER_REQUEST, SERIALIZER_SECONDS, DURATIONS]
+
+
+def observe(operation, seconds, outcome='ok'):
+    DURATIONS.observe(seconds, operation, outcome)
+
+
+class _RequestStats:
+    __slots__ = ('queries', 'query_seconds', 'serializer_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+class SerializerTimingMixin:
+    """
+    Credits the time spent in .data to the request being served. Give list
+    serializers the mixin too (Meta.list_serializer_class) so many=True is timed.
+    """
+
+    @property
+    def data(self):
+        stats = _current.get()
+        if stats is None:
+            return super().data
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            stats.serializer_seconds += time.perf_counter() - start
+
+
+_REGEX_GROUP = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+_REGEX_ANCHOR = re.compile(r'(^|/)\^|\$$')
+
+
+def _route(request):
+    # the URL pattern, not the path, so ids don't multiply the label values;
+    # router regexes are tidied to look like path() routes: api/requests/<pk>/
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return _REGEX_ANCHOR.sub(r'\1', _REGEX_GROUP.sub(r'<\1>', match.route))
+
+
+def _record(request, response, stats, seconds):
+    route = _route(request)
+    REQUEST_SECONDS.observe(seconds, route, request.method, response.status_code)
+    DB_QUERIES.inc(route, amount=stats.queries)
+    DB_SECONDS.inc(route, amount=stats.query_seconds)
+    QUERIES_PER_REQUEST.observe(stats.queries, route)
+    if stats.serializer_seconds:
+        SERIALIZER_SECONDS.observe(stats.serializer_seconds, route)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    # streaming responses are timed until the view returns, not until the body is sent
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = _RequestStats()
+            token = _current.set(stats)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _record(request, response, stats, time.perf_counter() - start)
+            return response
+    else:
+        def middleware(request):
+            stats = _RequestStats()
+            token = _current.set(stats)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            _record(request, response, stats, time.perf_counter() - start)
+            return response
+    return middleware
+
+
+def _gauges():
+    # read at scrape time from the modules that keep their own counters
+    from . import authentication, extraction_cache
+    from .events import get_broadcaster
+
+    lines = []
+    sources = (
+        ('extraction_cache', 'Extraction result cache', extraction_cache.stats()),
+        ('token_cache', 'Token authentication cache', authentication.stats()),
+    )
+    for prefix, description, values in sources:
+        for key, value in sorted(values.items()):
+            name = f'{prefix}_{key}' if key == 'hit_rate' else f'{prefix}_{key}_total'
+            kind = 'gauge' if key == 'hit_rate' else 'counter'
+            lines += [f'# HELP {name} {description}: {key.replace("_", " ")}.', f'# TYPE {name} {kind}', f'{name} {value}']
+    lines += [
+        '# HELP inbox_event_subscribers Open inbox event streams in this process.',
+        '# TYPE inbox_event_subscribers gauge',
+        f'inbox_event_subscribers {get_broadcaster().subscriber_count()}',
+    ]
+    return lines
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += _gauges()
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Set METRICS_TOKEN to require
+    `Authorization: Bearer <token>`.
+    """
+    expected = getattr(settings, 'METRICS_TOKEN', None)
+    if expected:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not constant_time_compare(supplied, expected):
+            return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def log_sampled(logger, event, **fields):
+    """
+    One JSON log line for `event`, for a LOG_SAMPLE_RATE fraction of calls.
+    """
+    if not logger.isEnabledFor(logging.INFO) or random.random() >= getattr(settings, 'LOG_SAMPLE_RATE', 0.01):
+        return
+    logger.info(json.dumps({'event': event, **fields}, default=str))
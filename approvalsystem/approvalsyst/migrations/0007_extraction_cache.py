@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('approvalsyst', '0006_extractionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proforma',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ExtractionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('extractor_version', models.PositiveSmallIntegerField()),
+                ('vendor_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('items', models.JSONField(default=list)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='approvalsys_last_us_eb7b14_idx')],
+                'unique_together': {('content_hash', 'extractor_version')},
+            },
+        ),
+    ]
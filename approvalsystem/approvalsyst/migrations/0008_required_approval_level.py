@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_levels(apps, schema_editor):
+    PurchaseRequest = apps.get_model('approvalsyst', 'PurchaseRequest')
+    RequiredApprovalLevel = apps.get_model('approvalsyst', 'RequiredApprovalLevel')
+    default_levels = getattr(settings, 'REQUIRED_APPROVAL_LEVELS', [1, 2])
+    rows = []
+    for pk, levels in PurchaseRequest.objects.values_list('pk', 'required_approval_levels').iterator(chunk_size=2000):
+        rows.extend(RequiredApprovalLevel(purchase_request_id=pk, level=level) for level in set(levels or default_levels))
+        if len(rows) >= 2000:
+            RequiredApprovalLevel.objects.bulk_create(rows)
+            rows = []
+    RequiredApprovalLevel.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('approvalsyst', '0007_extraction_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequiredApprovalLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField()),
+                ('purchase_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='level_requirements', to='approvalsyst.purchaserequest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['level', 'purchase_request'], name='approvalsys_level_e47a68_idx')],
+                'unique_together': {('purchase_request', 'level')},
+            },
+        ),
+        migrations.RunPython(backfill_levels, migrations.RunPython.noop),
+    ]
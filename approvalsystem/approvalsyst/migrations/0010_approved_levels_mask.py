@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:21
+
+from django.db import migrations, models
+
+
+def backfill_mask(apps, schema_editor):
+    PurchaseRequest = apps.get_model('approvalsyst', 'PurchaseRequest')
+    Approval = apps.get_model('approvalsyst', 'Approval')
+    masks = {}
+    approved = Approval.objects.filter(action='APPROVED').values_list('purchase_request_id', 'level')
+    for request_id, level in approved.iterator(chunk_size=2000):
+        masks[request_id] = masks.get(request_id, 0) | (1 << level)
+    for request_id, mask in masks.items():
+        PurchaseRequest.objects.filter(pk=request_id).update(approved_levels_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('approvalsyst', '0009_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='approved_levels_mask',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:28
+
+from decimal import Decimal
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def backfill_summary(apps, schema_editor):
+    # same definitions as summaries.compute_rows, against the historical models
+    PurchaseRequest = apps.get_model('approvalsyst', 'PurchaseRequest')
+    FinanceSummary = apps.get_model('approvalsyst', 'FinanceSummary')
+    zero = Value(Decimal('0'))
+    totals = dict(n=Count('id'), total=Coalesce(Sum('amount'), zero))
+    rows = [
+        FinanceSummary(dimension='status', key=r['status'], request_count=r['n'], total_amount=r['total'])
+        for r in PurchaseRequest.objects.order_by().values('status').annotate(**totals)
+    ]
+    approved = PurchaseRequest.objects.filter(status='APPROVED').order_by()
+    vendors = approved.annotate(vendor=Coalesce('po__vendor_name', 'proforma__vendor_name', Value(''))).values('vendor').annotate(**totals)
+    rows += [FinanceSummary(dimension='vendor', key=r['vendor'], request_count=r['n'], total_amount=r['total']) for r in vendors]
+    months = approved.annotate(month=TruncMonth('created_at')).values('month').annotate(**totals)
+    rows += [FinanceSummary(dimension='month', key=r['month'].strftime('%Y-%m'), request_count=r['n'], total_amount=r['total']) for r in months]
+    FinanceSummary.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('approvalsyst', '0010_approved_levels_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('status', 'Status'), ('vendor', 'Vendor'), ('month', 'Month')], max_length=10)),
+                ('key', models.CharField(blank=True, max_length=255)),
+                ('request_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('dimension', 'key')},
+            },
+        ),
+        migrations.RunPython(backfill_summary, migrations.RunPython.noop),
+    ]
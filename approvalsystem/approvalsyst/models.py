@@ -1,9 +1,34 @@
+import uuid
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
+# level N is bit N of approved_levels_mask, a signed 64-bit column on most backends
+MAX_APPROVAL_LEVEL = 62
+
+
+def clean_approval_levels(levels):
+    """
+    The distinct levels in `levels` as ints, in order. Raises ValidationError
+    unless it is a list of integers (or digit strings) from 1 to MAX_APPROVAL_LEVEL.
+    """
+    if not isinstance(levels, (list, tuple)):
+        raise ValidationError("Approval levels must be a list.")
+    cleaned = []
+    for level in levels:
+        if isinstance(level, str) and level.strip().isdigit():
+            level = int(level)
+        if isinstance(level, bool) or not isinstance(level, int) or not 1 <= level <= MAX_APPROVAL_LEVEL:
+            raise ValidationError(f"Approval levels must be integers from 1 to {MAX_APPROVAL_LEVEL}, got {level!r}.")
+        if level not in cleaned:
+            cleaned.append(level)
+    return cleaned
+
+
 # Create your models here.
 class PurchaseRequest(models.Model):
     STATUS_PENDING = 'PENDING'
@@ -30,10 +55,56 @@ class PurchaseRequest(models.Model):
 
     # optional: number of approval levels required - fallback to SETTINGS
     required_approval_levels = models.JSONField(default=list, blank=True)  # e.g. [1,2]
+    # approval progress: bit N set once level N approved, updated with the approval itself
+    approved_levels_mask = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        # list endpoints filter on status and/or created_by and page on (created_at, id)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='pr_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='pr_status_created_idx'),
+            models.Index(fields=['created_by', 'status', '-created_at', '-id'], name='pr_owner_status_created_idx'),
+        ]
 
     def is_editable(self):
         return self.status == self.STATUS_PENDING
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'required_approval_levels' in update_fields:
+            self.required_approval_levels = clean_approval_levels(self.required_approval_levels or [])
+        super().save(*args, **kwargs)
+
+    def effective_approval_levels(self):
+        return clean_approval_levels(self.required_approval_levels or getattr(settings, 'REQUIRED_APPROVAL_LEVELS', [1, 2]))
+
+    @staticmethod
+    def level_bit(level):
+        level = int(level)
+        if not 1 <= level <= MAX_APPROVAL_LEVEL:
+            raise ValueError(f"Approval level {level} is outside 1..{MAX_APPROVAL_LEVEL}.")
+        return 1 << level
+
+    def has_level_approved(self, level):
+        return bool(self.approved_levels_mask & self.level_bit(level))
+
+    def is_fully_approved(self):
+        required = 0
+        for level in self.effective_approval_levels():
+            required |= self.level_bit(level)
+        return self.approved_levels_mask & required == required
+
+    def sync_required_levels(self, created=False):
+        # keep the RequiredApprovalLevel rows in step with required_approval_levels
+        levels = set(self.effective_approval_levels())
+        existing = set() if created else set(self.level_requirements.values_list('level', flat=True))
+        if existing - levels:
+            self.level_requirements.filter(level__in=existing - levels).delete()
+        if levels - existing:
+            RequiredApprovalLevel.objects.bulk_create(
+                [RequiredApprovalLevel(purchase_request=self, level=level) for level in sorted(levels - existing)]
+            )
+
     def __str__(self):
         return f"{self.title} ({self.status})"
 
@@ -49,6 +120,17 @@ class RequestItem(models.Model):
         return self.qty * self.unit_price
 
 
+class RequiredApprovalLevel(models.Model):
+    # indexed copy of PurchaseRequest.required_approval_levels so approver
+    # inboxes can be filtered in SQL instead of in Python
+    purchase_request = models.ForeignKey(PurchaseRequest, related_name='level_requirements', on_delete=models.CASCADE)
+    level = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('purchase_request', 'level')
+        indexes = [models.Index(fields=['level', 'purchase_request'])]
+
+
 class Approval(models.Model):
     APPROVED = 'APPROVED'
     REJECTED = 'REJECTED'
@@ -63,11 +145,13 @@ class Approval(models.Model):
 
     class Meta:
         unique_together = ('purchase_request', 'approver', 'level')  # prevents duplicate same-level approvals
+        # rejection checks and the pending inbox look approvals up by (request, action, level)
+        indexes = [models.Index(fields=['purchase_request', 'action', 'level'], name='approval_pr_action_level_idx')]
 
 class PurchaseOrder(models.Model):
     proforma = models.ForeignKey('Proforma', null=True, blank=True, on_delete=models.CASCADE)
     vendor_name = models.CharField(max_length=255)
-    items = models.TextField(default='')  # could be JSON or plain text
+    items = models.TextField(default='')  # JSON list of the proforma lines
     total_amount = models.DecimalField(max_digits=10, decimal_places=2,default=0.00)
     purchase_request = models.OneToOneField(PurchaseRequest, related_name='po', on_delete=models.CASCADE)
     generated_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
@@ -75,10 +159,156 @@ class PurchaseOrder(models.Model):
     po_file = models.FileField(upload_to='purchase_orders/', null=True, blank=True)  # can be populated by generator
     reference = models.CharField(max_length=100, blank=True, null=True)
 
+    # PDF rendering, done in batches by `manage.py run_po_generator` (po_documents.py)
+    RENDER_PENDING = 'PENDING'
+    RENDER_RUNNING = 'RUNNING'
+    RENDER_DONE = 'DONE'
+    RENDER_FAILED = 'FAILED'
+    RENDER_CHOICES = [
+        (RENDER_PENDING, 'Pending'),
+        (RENDER_RUNNING, 'Running'),
+        (RENDER_DONE, 'Done'),
+        (RENDER_FAILED, 'Failed'),
+    ]
+    render_status = models.CharField(max_length=10, choices=RENDER_CHOICES, default=RENDER_PENDING)
+    render_started_at = models.DateTimeField(null=True, blank=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+    render_ms = models.FloatField(null=True, blank=True)
+    render_error = models.TextField(blank=True)
+
+    class Meta:
+        # the generator polls for the oldest pending documents
+        indexes = [models.Index(fields=['render_status', 'generated_at'], name='po_render_queue_idx')]
+
 class Proforma(models.Model):
     file = models.FileField(upload_to='proformas/')
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # sha256 of the uploaded bytes
     vendor_name = models.CharField(max_length=255, blank=True, null=True)
     items = models.JSONField(blank=True, null=True)  # list of {name, qty, unit_price}
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
\ No newline at end of file
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+
+
+class ExtractionCache(models.Model):
+    # extraction result for a given file content, reused for duplicate uploads
+    content_hash = models.CharField(max_length=64)
+    extractor_version = models.PositiveSmallIntegerField()
+    vendor_name = models.CharField(max_length=255, blank=True, null=True)
+    items = models.JSONField(default=list)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('content_hash', 'extractor_version')
+        indexes = [models.Index(fields=['last_used_at'])]
+
+
+class ExtractionJob(models.Model):
+    STATUS_QUEUED = 'QUEUED'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_DONE = 'DONE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    proforma = models.OneToOneField(Proforma, related_name='extraction_job', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # filled in once the extracted data has been turned into a request
+    purchase_request = models.ForeignKey(PurchaseRequest, null=True, blank=True, related_name='extraction_jobs', on_delete=models.SET_NULL)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # workers poll for the oldest queued jobs
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Extraction job {self.pk} ({self.status})"
+
+
+class FinanceSummary(models.Model):
+    # Precomputed request totals, kept up to date in the same transaction as the
+    # change that moves them (see summaries.py). Rebuild with rebuild_finance_summary.
+    DIMENSION_STATUS = 'status'    # every request, keyed by status
+    DIMENSION_VENDOR = 'vendor'    # approved requests, keyed by PO / proforma vendor
+    DIMENSION_MONTH = 'month'      # approved requests, keyed by created_at month (YYYY-MM)
+    DIMENSION_CHOICES = [
+        (DIMENSION_STATUS, 'Status'),
+        (DIMENSION_VENDOR, 'Vendor'),
+        (DIMENSION_MONTH, 'Month'),
+    ]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=255, blank=True)
+    request_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('dimension', 'key')
+
+    def __str__(self):
+        return f"{self.dimension}={self.key}: {self.request_count} / {self.total_amount}"
+
+
+class UploadSession(models.Model):
+    # Resumable chunked upload. Bytes go to a partial file in CHUNKED_UPLOAD_DIR;
+    # `offset` is how much of it is confirmed. See uploads.py for the protocol.
+    TARGET_PROFORMA = 'proforma'
+    TARGET_RECEIPT = 'receipt'
+    TARGET_CHOICES = [
+        (TARGET_PROFORMA, 'Proforma'),
+        (TARGET_RECEIPT, 'Receipt'),
+    ]
+    STATUS_ACTIVE = 'ACTIVE'
+    STATUS_COMMITTED = 'COMMITTED'
+    STATUS_ABORTED = 'ABORTED'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_COMMITTED, 'Committed'),
+        (STATUS_ABORTED, 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    target = models.CharField(max_length=10, choices=TARGET_CHOICES)
+    # receipts are attached to this request on commit
+    purchase_request = models.ForeignKey(PurchaseRequest, null=True, blank=True, related_name='upload_sessions', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    # set while a chunk is being written, so two chunks can't interleave
+    busy_since = models.DateTimeField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    proforma = models.ForeignKey(Proforma, null=True, blank=True, on_delete=models.SET_NULL)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.pk} ({self.offset}/{self.size})"
+
+
+class StoredBlob(models.Model):
+    # One deduplicated file written by ContentAddressedStorage (storage.py).
+    # refcount follows storage saves/deletes and is reconciled by gc_blobs.
+    name = models.CharField(max_length=100, unique=True)  # storage name, blobs/ab/cd/<sha256><ext>
+    content_hash = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
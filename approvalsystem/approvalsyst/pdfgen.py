@@ -0,0 +1,59 @@
+# pdfgen.py
+# Minimal text-only PDF writer (Helvetica, A4). Enough for generated documents
+# and synthetic test proformas without pulling in a PDF library.
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 11
+LEADING = 14
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+
+def _escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def paginate(lines, per_page=LINES_PER_PAGE):
+    lines = list(lines)
+    return [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+
+def render_text_pdf(pages):
+    """
+    Build a PDF from a list of pages, each a list of text lines. Returns bytes.
+    """
+    objects = [None, None]  # catalog and page tree, filled in below
+    page_refs = []
+    font_ref = 3
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    for lines in pages:
+        body = ' '.join(f"({_escape(line)}) '" for line in lines)
+        stream = f"BT /F1 {FONT_SIZE} Tf {LEADING} TL {MARGIN} {PAGE_HEIGHT - MARGIN} Td {body} ET".encode('latin-1', 'replace')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        content_ref = len(objects)
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 {font_ref} 0 R >> >> /Contents {content_ref} 0 R >>'
+        )
+        page_refs.append(len(objects))
+
+    objects[0] = '<< /Type /Catalog /Pages 2 0 R >>'
+    kids = ' '.join(f'{ref} 0 R' for ref in page_refs)
+    objects[1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>'
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        if isinstance(obj, str):
+            obj = obj.encode('latin-1')
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
@@ -1,21 +1,77 @@
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import permissions
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
-class IsFinance(BasePermission):
-    def has_permission(self, request, view):
-        return request.user.groups.filter(name='finance').exists()
+APPROVER_GROUP_PREFIX = 'approver-level-'
+
+
+def _roles_cache_key(user_id):
+    return f'user-roles:{user_id}'
+
+
+def get_user_groups(user):
+    """
+    The user's group names ordered by id. Loaded once per request (kept on the
+    user object) and shared across requests through the cache; signals.py drops
+    the cached entry whenever the user's groups change.
+    """
+    if not user.is_authenticated:
+        return ()
+    names = getattr(user, '_group_names', None)
+    if names is None:
+        key = _roles_cache_key(user.pk)
+        names = cache.get(key)
+        if names is None:
+            names = tuple(user.groups.order_by('pk').values_list('name', flat=True))
+            cache.set(key, names, getattr(settings, 'ROLE_CACHE_TTL', 300))
+        user._group_names = names
+    return names
+
+
+async def aget_user_groups(user):
+    # get_user_groups for async views; afterwards the sync helpers below find
+    # the names on the user and don't query
+    if not user.is_authenticated:
+        return ()
+    names = getattr(user, '_group_names', None)
+    if names is None:
+        key = _roles_cache_key(user.pk)
+        names = await cache.aget(key)
+        if names is None:
+            names = tuple([name async for name in user.groups.order_by('pk').values_list('name', flat=True)])
+            await cache.aset(key, names, getattr(settings, 'ROLE_CACHE_TTL', 300))
+        user._group_names = names
+    return names
+
+
+def invalidate_user_groups(*user_ids):
+    cache.delete_many([_roles_cache_key(user_id) for user_id in user_ids])
+
+
+def get_approver_level(user):
+    # level of the user's first approver group, e.g. 1 for 'approver-level-1'
+    for name in get_user_groups(user):
+        if name.startswith(APPROVER_GROUP_PREFIX):
+            try:
+                return int(name.split('-')[-1])
+            except (IndexError, ValueError):
+                return None
+    return None
+
 
 def user_has_role(user, role_name):
     if not user.is_authenticated:
         return False
 
+    groups = get_user_groups(user)
     # Approver roles: match dynamic levels like approver-level-1, approver-level-2, ...
     if role_name == 'approver':
-        return user.groups.filter(name__startswith='approver-level-').exists()
+        return any(name.startswith(APPROVER_GROUP_PREFIX) for name in groups)
 
     # Finance, staff, etc: exact match
     return (
-        user.groups.filter(name=role_name).exists() or 
+        role_name in groups or
         getattr(user, 'role', None) == role_name
     )
 
@@ -25,7 +81,7 @@ class IsStaff(permissions.BasePermission):
 
 class IsApprover(permissions.BasePermission):
     def has_permission(self, request, view):
-        return user_has_role(request.user, 'approver') or user_has_role(request.user, 'approver-level-1') or user_has_role(request.user, 'approver-level-2')
+        return user_has_role(request.user, 'approver')
 
 class IsFinance(permissions.BasePermission):
     def has_permission(self, request, view):
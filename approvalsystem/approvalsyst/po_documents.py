@@ -0,0 +1,146 @@
+# po_documents.py
+# Purchase order PDFs, rendered in batches outside the request path. approve
+# only inserts the PurchaseOrder row (render_status PENDING); the generator
+# (`manage.py run_po_generator`) claims pending rows, renders them with one
+# template compiled per process and saves the file through the default storage.
+import ast
+import json
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.template import Context, Engine
+from django.utils import timezone
+
+from . import metrics
+from .models import PurchaseOrder, PurchaseRequest
+from .pdfgen import paginate, render_text_pdf
+
+PO_TEMPLATE = """PURCHASE ORDER {{ po.reference|default:po.pk }}
+Date: {{ po.generated_at|date:"Y-m-d" }}
+Vendor: {{ po.vendor_name|default:"-" }}
+Request: #{{ pr.pk }} {{ pr.title }}
+Requested by: {{ pr.created_by.username }}
+Approved by: {{ po.generated_by.username|default:"-" }}
+
+Item                                      Qty      Unit price        Total
+{% for item in items %}{{ item.name|truncatechars:40|ljust:"40" }} {{ item.qty|rjust:"5" }} {{ item.unit_price|rjust:"15" }} {{ item.total|rjust:"12" }}
+{% endfor %}
+Total: {{ po.total_amount }}
+"""
+
+_template = None
+
+
+def get_template():
+    # compiled once per process and reused for every document
+    global _template
+    if _template is None:
+        _template = Engine(autoescape=False).from_string(PO_TEMPLATE)
+    return _template
+
+
+def _items(po):
+    items = [
+        {'name': item.name, 'qty': item.qty, 'unit_price': item.unit_price, 'total': item.total}
+        for item in po.purchase_request.items.all()
+    ]
+    if items:
+        return items
+    # no request items: fall back to the extracted proforma lines
+    parsed = po.proforma.items if po.proforma is not None else None
+    if parsed is None:
+        parsed = _parse_items(po.items)
+    if not isinstance(parsed, list):
+        return []
+    return [
+        {
+            'name': item.get('name', ''),
+            'qty': item.get('qty', 1),
+            'unit_price': item.get('unit_price', ''),
+            'total': item.get('total', ''),
+        }
+        for item in parsed if isinstance(item, dict)
+    ]
+
+
+def _parse_items(text):
+    # JSON; orders created before that hold the Python repr of the list
+    if not text:
+        return []
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return []
+
+
+def render_po(po):
+    """
+    PDF bytes for one purchase order.
+    """
+    text = get_template().render(Context({'po': po, 'pr': po.purchase_request, 'items': _items(po)}))
+    return render_text_pdf(paginate(text.splitlines()))
+
+
+def claim_batch(size):
+    """
+    Mark up to `size` pending orders as running and return them, ready to
+    render. The claim stamp keeps concurrent generators off each other's rows.
+    Orders created at upload wait here until their request is approved.
+    """
+    ids = list(
+        PurchaseOrder.objects.filter(
+            render_status=PurchaseOrder.RENDER_PENDING,
+            purchase_request__status=PurchaseRequest.STATUS_APPROVED,
+        )
+        .order_by('generated_at').values_list('pk', flat=True)[:size]
+    )
+    if not ids:
+        return []
+    stamp = timezone.now()
+    PurchaseOrder.objects.filter(pk__in=ids, render_status=PurchaseOrder.RENDER_PENDING).update(
+        render_status=PurchaseOrder.RENDER_RUNNING, render_started_at=stamp,
+    )
+    return list(
+        PurchaseOrder.objects.filter(pk__in=ids, render_status=PurchaseOrder.RENDER_RUNNING, render_started_at=stamp)
+        .select_related('purchase_request__created_by', 'generated_by', 'proforma')
+        .prefetch_related('purchase_request__items')
+        .order_by('generated_at')
+    )
+
+
+def render_batch(orders):
+    """
+    Render and store each order, then record the results with one bulk update.
+    Returns the per-order render times in milliseconds.
+    """
+    timings = []
+    for po in orders:
+        start = time.perf_counter()
+        try:
+            pdf = render_po(po)
+            po.po_file.save(f'{po.reference or po.pk}.pdf', ContentFile(pdf), save=False)
+        except Exception as exc:
+            po.render_status = PurchaseOrder.RENDER_FAILED
+            po.render_error = f"{type(exc).__name__}: {exc}"
+        else:
+            po.render_status = PurchaseOrder.RENDER_DONE
+            po.render_error = ''
+        po.render_ms = (time.perf_counter() - start) * 1000
+        po.rendered_at = timezone.now()
+        timings.append(po.render_ms)
+        metrics.observe('po_render', po.render_ms / 1000, 'ok' if po.render_status == PurchaseOrder.RENDER_DONE else 'error')
+    PurchaseOrder.objects.bulk_update(orders, ['po_file', 'render_status', 'render_error', 'render_ms', 'rendered_at'])
+    return timings
+
+
+def requeue_stale(older_than):
+    # a generator died mid-batch: put its rows back
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return PurchaseOrder.objects.filter(
+        render_status=PurchaseOrder.RENDER_RUNNING, render_started_at__lt=cutoff
+    ).update(render_status=PurchaseOrder.RENDER_PENDING)
@@ -1,51 +1,112 @@
 from rest_framework import serializers
-from .models import PurchaseRequest, RequestItem, Approval, Proforma, PurchaseOrder
+from rest_framework.utils import html
+from .models import MAX_APPROVAL_LEVEL, PurchaseRequest, RequestItem, Approval, Proforma, PurchaseOrder, ExtractionJob, UploadSession
+from .permissions import get_user_groups
+from .summaries import SummaryDelta
+from .events import InboxChanges
+from .metrics import SerializerTimingMixin, log_sampled
 from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from decimal import Decimal
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class RequestItemSerializer(serializers.ModelSerializer):
+    # writable so updates can say which existing item a line refers to
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = RequestItem
         fields = ('id', 'name', 'qty', 'unit_price', 'total')
         read_only_fields = ('total',)
 
-class PurchaseRequestSerializer(serializers.ModelSerializer):
+
+def _item_values(item):
+    return item['name'], item.get('qty', 1), item.get('unit_price', Decimal('0'))
+
+
+class ApprovalLevelsField(serializers.ListField):
+    child = serializers.IntegerField(min_value=1, max_value=MAX_APPROVAL_LEVEL)
+
+    def get_value(self, dictionary):
+        value = super().get_value(dictionary)
+        # multipart requests may send the whole list as one JSON string, like items
+        if html.is_html_input(dictionary) and isinstance(value, list) and len(value) == 1:
+            try:
+                parsed = json.loads(value[0])
+            except (TypeError, ValueError):
+                return value
+            if isinstance(parsed, list):
+                return parsed
+        return value
+
+
+class TimedListSerializer(SerializerTimingMixin, serializers.ListSerializer):
+    pass
+
+
+class PurchaseRequestSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     items = RequestItemSerializer(many=True, required=False)
     created_by = serializers.PrimaryKeyRelatedField(read_only=True)
     status = serializers.CharField(read_only=True)
+    required_approval_levels = ApprovalLevelsField(required=False)
 
     class Meta:
         model = PurchaseRequest
         fields = ('id','title','description','amount','status','created_by','created_at','updated_at','proforma','purchase_order','receipt','items','required_approval_levels')
+        list_serializer_class = TimedListSerializer
         read_only_fields = ('purchase_order','amount',)
 
-    def create(self, validated_data):
+    def _request_items(self, validated_items):
+        if validated_items:
+            return validated_items
+        # multipart requests send items as a JSON string, which the nested field skips
         items_data = self.context['request'].data.get('items', [])
         if isinstance(items_data, str):
             try:
                 items_data = json.loads(items_data)
             except json.JSONDecodeError:
                 items_data = []
+        if not items_data:
+            return []
+        items = RequestItemSerializer(data=items_data, many=True)
+        items.is_valid(raise_exception=True)
+        return items.validated_data
+
+    def create(self, validated_data):
+        items_data = self._request_items(validated_data.pop('items', None))
 
         user = self.context['request'].user
         validated_data['created_by'] = user
-        validated_data.pop('items', None)
 
         # Calculate total amount from items
-        total_amount = sum(item['qty'] * item['unit_price'] for item in items_data)
+        items = []
+        total_amount = Decimal('0')
+        for item in items_data:
+            name, qty, unit_price = _item_values(item)
+            items.append(RequestItem(name=name, qty=qty, unit_price=unit_price))
+            total_amount += qty * unit_price
         validated_data['amount'] = total_amount
-        print("items_data:", items_data)
-        print("total_amount:", total_amount)
+        log_sampled(logger, 'request_create', user=user.username, items=len(items), total_amount=total_amount)
 
         if not validated_data.get('required_approval_levels'):
             validated_data['required_approval_levels'] = getattr(settings, 'REQUIRED_APPROVAL_LEVELS', [1,2])
 
-        pr = PurchaseRequest.objects.create(**validated_data)
-        for item in items_data:
-            RequestItem.objects.create(request=pr, **item)
+        with transaction.atomic():
+            pr = PurchaseRequest.objects.create(**validated_data)
+            for item in items:
+                item.request = pr
+            RequestItem.objects.bulk_create(items)
+            summary, inbox = SummaryDelta(), InboxChanges()
+            summary.add(pr)
+            inbox.add(pr)
+            inbox.publish()
+            summary.apply()
         return pr
 
     def update(self, instance, validated_data):
@@ -53,15 +114,64 @@ class PurchaseRequestSerializer(serializers.ModelSerializer):
         if instance.status != PurchaseRequest.STATUS_PENDING:
             raise serializers.ValidationError("Only pending requests can be updated.")
         items_data = validated_data.pop('items', None)
+        summary, inbox = SummaryDelta(), InboxChanges()
+        summary.remove(instance)
+        inbox.remove(instance)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
-        if items_data is not None:
-            instance.items.all().delete()
-            for item in items_data:
-                RequestItem.objects.create(request=instance, **item)
+
+        with transaction.atomic():
+            if items_data is not None:
+                # Diff against the stored items by id: unchanged lines cost nothing,
+                # the rest is one bulk insert / bulk update / delete each.
+                existing = {item.pk: item for item in instance.items.all()}
+                to_create, to_update, kept = [], [], set()
+                total_amount = Decimal('0')
+                for data in items_data:
+                    name, qty, unit_price = _item_values(data)
+                    total_amount += qty * unit_price
+                    item_id = data.get('id')
+                    if item_id is None:
+                        to_create.append(RequestItem(request=instance, name=name, qty=qty, unit_price=unit_price))
+                        continue
+                    if item_id not in existing:
+                        raise serializers.ValidationError({'items': f"Item {item_id} is not part of this request."})
+                    if item_id in kept:
+                        raise serializers.ValidationError({'items': f"Item {item_id} is listed more than once."})
+                    item = existing[item_id]
+                    kept.add(item.pk)
+                    if (item.name, item.qty, item.unit_price) != (name, qty, unit_price):
+                        item.name, item.qty, item.unit_price = name, qty, unit_price
+                        to_update.append(item)
+
+                removed = existing.keys() - kept
+                if removed:
+                    RequestItem.objects.filter(pk__in=removed).delete()
+                RequestItem.objects.bulk_create(to_create)
+                RequestItem.objects.bulk_update(to_update, ['name', 'qty', 'unit_price'])
+                instance.amount = total_amount
+            instance.save()
+            # only an amount change moves the totals, a levels change the inboxes
+            summary.add(instance)
+            inbox.add(instance)
+            inbox.publish()
+            summary.apply()
         return instance
 
+class BulkActionSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=['approve', 'reject'])
+    # a list only: a string would iterate as digits, "71" -> [7, 1]
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    comment = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_ids(self, value):
+        max_ids = getattr(settings, 'BULK_ACTION_MAX_IDS', 500)
+        ids = list(dict.fromkeys(value))
+        if len(ids) > max_ids:
+            raise serializers.ValidationError(f"Send between 1 and {max_ids} ids.")
+        return ids
+
+
 class ApprovalSerializer(serializers.ModelSerializer):
     approver = serializers.PrimaryKeyRelatedField(read_only=True)
     class Meta:
@@ -69,24 +179,57 @@ class ApprovalSerializer(serializers.ModelSerializer):
         fields = ('id','purchase_request','approver','level','action','comment','created_at')
         read_only_fields = ('approver','created_at')
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     role = serializers.SerializerMethodField()
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role']
     def get_role(self, obj):
-        print("User groups:", obj.groups.all())
-        if obj.groups.exists():
-            return obj.groups.first().name.lower()   # example: "staff", "finance"
+        groups = get_user_groups(obj)
+        log_sampled(logger, 'user_role', user=obj.username, groups=groups)
+        if groups:
+            return groups[0].lower()   # example: "staff", "finance"
         return "staff"
     
-class PurchaseOrderSerializer(serializers.ModelSerializer):
+class PurchaseOrderSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     class Meta:
         model = PurchaseOrder
-        fields = ['id', 'proforma', 'vendor_name', 'items', 'total_amount', 'generated_by', 'generated_at']
+        fields = ['id', 'proforma', 'vendor_name', 'items', 'total_amount', 'generated_by', 'generated_at', 'reference', 'po_file', 'render_status', 'rendered_at']
     items = serializers.JSONField()
 
-class ProformaSerializer(serializers.ModelSerializer):
+class ProformaSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     class Meta:
         model = Proforma
         fields = ['id', 'file', 'vendor_name', 'items', 'total_amount', 'uploaded_at']
+
+class ExtractionJobSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    proforma = ProformaSerializer(read_only=True)
+    purchase_order = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExtractionJob
+        fields = ['id', 'status', 'error', 'proforma', 'purchase_request', 'purchase_order', 'created_at', 'started_at', 'finished_at']
+
+    def get_purchase_order(self, obj):
+        po = PurchaseOrder.objects.filter(purchase_request_id=obj.purchase_request_id).first() if obj.purchase_request_id else None
+        return PurchaseOrderSerializer(po).data if po else None
+
+
+class UploadSessionSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'purchase_request', 'filename', 'size', 'offset', 'status', 'content_hash', 'proforma', 'created_at', 'updated_at']
+        read_only_fields = ['offset', 'status', 'content_hash', 'proforma']
+
+    def validate_size(self, value):
+        max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 200 * 1024 * 1024)
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f"Size must be between 1 and {max_size} bytes.")
+        return value
+
+    def validate(self, attrs):
+        if attrs['target'] == UploadSession.TARGET_RECEIPT and not attrs.get('purchase_request'):
+            raise serializers.ValidationError({'purchase_request': "Receipts need the request they belong to."})
+        if attrs['target'] == UploadSession.TARGET_PROFORMA:
+            attrs['purchase_request'] = None
+        return attrs
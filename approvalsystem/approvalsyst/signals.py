@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens, invalidate_user_tokens
+from .models import PurchaseRequest
+from .permissions import invalidate_user_groups
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # invalidate after the rows change, so a read in between can't re-cache the old groups
+    if action == 'pre_clear' and reverse:
+        # group.user_set.clear(): pk_set isn't provided, collect the members first
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # user.groups.add(...) / remove / clear
+        instance.__dict__.pop('_group_names', None)
+        invalidate_user_groups(instance.pk)
+    elif action == 'post_clear':
+        invalidate_user_groups(*instance.__dict__.pop('_cleared_user_ids', ()))
+    else:
+        invalidate_user_groups(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # renamed or deleted group: every member's role set changes
+    if instance.pk:
+        invalidate_user_groups(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    # a recycled primary key must not inherit a deleted user's roles
+    if created:
+        invalidate_user_groups(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    # deactivation, password change: cached tokens must see the new row
+    if not created and not raw:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_user_groups(instance.pk)
+
+
+@receiver(post_save, sender=PurchaseRequest)
+def purchase_request_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is None or 'required_approval_levels' in update_fields:
+        instance.sync_required_levels(created=created)
@@ -0,0 +1,176 @@
+# storage.py
+# Content-addressed file storage. Every save is hashed while it is copied and
+# lands at blobs/<h[:2]>/<h[2:4]>/<sha256><ext>, so identical uploads share one
+# file whatever field or upload_to they came through. FileFields keep working
+# as before: the name they store is simply the blob's name, and names written
+# before this storage (proformas/..., receipts/...) still resolve under MEDIA_ROOT.
+#
+# Deletes only drop a reference; `manage.py gc_blobs` recounts references from
+# the FileFields and removes blobs nobody points at.
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def blob_prefix():
+    return getattr(settings, 'BLOB_STORAGE_PREFIX', 'blobs')
+
+
+def blob_name(content_hash, ext):
+    return f"{blob_prefix()}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(blob_prefix() + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # the final name comes from the content, see _save
+        return name
+
+    def _save(self, name, content):
+        StoredBlob = apps.get_model('approvalsyst', 'StoredBlob')
+        ext = os.path.splitext(name)[1].lower()[:10]
+        tmp_dir = self.path(f'{blob_prefix()}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    tmp.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+
+            final = blob_name(digest.hexdigest(), ext)
+            now = timezone.now()
+            # The increment locks the blob row until the caller's transaction
+            # ends; collect_garbage holds the same lock while it unlinks, so a
+            # save either waits for the row to go (and writes the file anew)
+            # or keeps it alive.
+            with transaction.atomic(savepoint=False):
+                reused = StoredBlob.objects.filter(name=final).update(refcount=F('refcount') + 1, last_used_at=now)
+                if reused and self.exists(final):
+                    os.remove(tmp_path)
+                    return final
+
+                path = self.path(final)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+                if not reused:
+                    # if the same bytes were saved concurrently this reference goes
+                    # uncounted until gc_blobs recounts; the blob is still kept
+                    StoredBlob.objects.bulk_create(
+                        [StoredBlob(name=final, content_hash=digest.hexdigest(), size=size, refcount=1, last_used_at=now)],
+                        ignore_conflicts=True,
+                    )
+            return final
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, name):
+        if not is_blob(name):
+            return super().delete(name)
+        # other rows may share the file; gc_blobs removes it once unreferenced
+        StoredBlob = apps.get_model('approvalsyst', 'StoredBlob')
+        StoredBlob.objects.filter(name=name).update(refcount=F('refcount') - 1)
+
+
+def referenced_blob_names():
+    """
+    Count references to each blob across every FileField in the app.
+    """
+    counts = {}
+    for model in apps.get_app_config('approvalsyst').get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                names = model.objects.filter(**{f'{field.name}__startswith': blob_prefix() + '/'}).values_list(field.name, flat=True)
+                for name in names.iterator(chunk_size=2000):
+                    counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def collect_garbage(grace_seconds, dry_run=False):
+    """
+    Reconcile refcounts with the FileFields, then delete blobs (and stray files
+    under the blob directory) that nothing references and that haven't been
+    used for `grace_seconds`. The grace period covers saves whose row isn't
+    committed yet. Returns (recounted, deleted names).
+    """
+    StoredBlob = apps.get_model('approvalsyst', 'StoredBlob')
+    storage = ContentAddressedStorage()
+    started = timezone.now()
+    cutoff = started - timedelta(seconds=grace_seconds)
+    counts = referenced_blob_names()
+
+    recounted = []
+    known = set()
+    for blob in StoredBlob.objects.iterator(chunk_size=2000):
+        known.add(blob.name)
+        count = counts.get(blob.name, 0)
+        # a row saved to since the counts were taken may have references they
+        # miss; it and any row changed after this read are left for the next run
+        if blob.refcount == count or blob.last_used_at >= started:
+            continue
+        if dry_run or StoredBlob.objects.filter(pk=blob.pk, refcount=blob.refcount, last_used_at__lt=started).update(refcount=count):
+            blob.refcount = count
+            recounted.append(blob)
+
+    deleted = []
+    for name in StoredBlob.objects.filter(refcount__lte=0, last_used_at__lt=cutoff).values_list('name', flat=True):
+        if name in counts:
+            continue
+        if dry_run or _delete_blob(storage, name, cutoff):
+            deleted.append(name)
+
+    # files with no row at all: rolled-back saves, interrupted temp files
+    root = storage.path(blob_prefix())
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in known or name in counts:
+                continue
+            if os.path.getmtime(path) >= cutoff.timestamp():
+                continue
+            if not dry_run:
+                os.remove(path)
+            deleted.append(name)
+    return recounted, deleted
+
+
+def _delete_blob(storage, name, cutoff):
+    StoredBlob = apps.get_model('approvalsyst', 'StoredBlob')
+    with transaction.atomic():
+        # re-check under the row lock: a save may have reused the blob since.
+        # Saves wait on the lock, so none can bump the row between this and the
+        # unlink; the row goes last, so a save that got in anyway finds it
+        # with a missing file and writes it again.
+        unused = StoredBlob.objects.select_for_update().filter(name=name, refcount__lte=0, last_used_at__lt=cutoff)
+        if not unused.exists():
+            return False
+        _remove(storage, name)
+        return bool(unused.delete()[0])
+
+
+def _remove(storage, name):
+    try:
+        os.remove(storage.path(name))
+    except FileNotFoundError:
+        pass
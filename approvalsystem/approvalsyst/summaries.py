@@ -0,0 +1,153 @@
+# summaries.py
+# Incremental maintenance of FinanceSummary. Callers describe a change by
+# removing a request's old contribution and adding its new one, then apply the
+# net deltas as the last statement of the transaction that makes the change:
+#
+#     delta = SummaryDelta()
+#     delta.remove(pr)
+#     pr.status = PurchaseRequest.STATUS_APPROVED
+#     pr.save()
+#     delta.add(pr)
+#     delta.apply()
+#
+# Every create/approve/reject/delete touches the ('status', 'PENDING') row, so
+# its row lock serializes those writers from apply() until commit. Keeping
+# apply() last (after inbox.publish(), which only queues on_commit callbacks)
+# keeps that window to the UPDATE itself.
+#
+# rebuild() recomputes everything from PurchaseRequest for backfills/drift.
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import FinanceSummary, PurchaseRequest
+
+
+def vendor_of(pr):
+    # PO vendor first, then the proforma's; callers select_related both
+    po = getattr(pr, 'po', None)
+    if po is not None:
+        return po.vendor_name or ''
+    if pr.proforma_id:
+        return pr.proforma.vendor_name or ''
+    return ''
+
+
+def month_of(pr):
+    return timezone.localtime(pr.created_at).strftime('%Y-%m')
+
+
+def contributions(pr):
+    keys = [(FinanceSummary.DIMENSION_STATUS, pr.status)]
+    if pr.status == PurchaseRequest.STATUS_APPROVED:
+        keys.append((FinanceSummary.DIMENSION_VENDOR, vendor_of(pr)))
+        keys.append((FinanceSummary.DIMENSION_MONTH, month_of(pr)))
+    return keys
+
+
+class SummaryDelta:
+
+    def __init__(self):
+        self.rows = defaultdict(lambda: [0, Decimal('0')])
+
+    def _change(self, pr, sign):
+        amount = Decimal(pr.amount or 0)
+        for key in contributions(pr):
+            row = self.rows[key]
+            row[0] += sign
+            row[1] += sign * amount
+
+    def add(self, pr):
+        self._change(pr, 1)
+
+    def remove(self, pr):
+        self._change(pr, -1)
+
+    def apply(self):
+        """
+        Add the net deltas with a single UPDATE over the touched rows; rows
+        that don't exist yet are created (first request of a new month/vendor).
+        The UPDATE locks the status rows until commit, so call this last.
+        """
+        moved = {key: row for key, row in self.rows.items() if row[0] or row[1]}
+        self.rows.clear()
+        if not moved:
+            return
+        now = timezone.now()
+        match = Q()
+        counts, amounts = [], []
+        for (dimension, key), (count, amount) in moved.items():
+            condition = Q(dimension=dimension, key=key)
+            match |= condition
+            counts.append(When(condition, then=Value(count)))
+            amounts.append(When(condition, then=Value(amount)))
+        updated = FinanceSummary.objects.filter(match).update(
+            request_count=F('request_count') + Case(*counts, default=Value(0), output_field=IntegerField()),
+            total_amount=F('total_amount') + Case(*amounts, default=Value(Decimal('0')), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            updated_at=now,
+        )
+        if updated == len(moved):
+            return
+
+        existing = set(FinanceSummary.objects.filter(match).values_list('dimension', 'key'))
+        for (dimension, key), (count, amount) in sorted(moved.items()):
+            if (dimension, key) in existing:
+                continue
+            try:
+                with transaction.atomic():
+                    FinanceSummary.objects.create(dimension=dimension, key=key, request_count=count, total_amount=amount, updated_at=now)
+            except IntegrityError:
+                # created concurrently since the UPDATE above
+                FinanceSummary.objects.filter(dimension=dimension, key=key).update(
+                    request_count=F('request_count') + count,
+                    total_amount=F('total_amount') + amount,
+                    updated_at=now,
+                )
+
+
+def compute_rows():
+    zero = Value(Decimal('0'))
+    rows = []
+    for row in PurchaseRequest.objects.order_by().values('status').annotate(n=Count('id'), total=Coalesce(Sum('amount'), zero)):
+        rows.append(FinanceSummary(dimension=FinanceSummary.DIMENSION_STATUS, key=row['status'], request_count=row['n'], total_amount=row['total']))
+
+    approved = PurchaseRequest.objects.filter(status=PurchaseRequest.STATUS_APPROVED).order_by()
+    vendors = (
+        approved.annotate(vendor=Coalesce('po__vendor_name', 'proforma__vendor_name', Value('')))
+        .values('vendor').annotate(n=Count('id'), total=Coalesce(Sum('amount'), zero))
+    )
+    for row in vendors:
+        rows.append(FinanceSummary(dimension=FinanceSummary.DIMENSION_VENDOR, key=row['vendor'], request_count=row['n'], total_amount=row['total']))
+
+    months = approved.annotate(month=TruncMonth('created_at')).values('month').annotate(n=Count('id'), total=Coalesce(Sum('amount'), zero))
+    for row in months:
+        rows.append(FinanceSummary(dimension=FinanceSummary.DIMENSION_MONTH, key=row['month'].strftime('%Y-%m'), request_count=row['n'], total_amount=row['total']))
+    return rows
+
+
+def rebuild():
+    rows = compute_rows()
+    with transaction.atomic():
+        FinanceSummary.objects.all().delete()
+        FinanceSummary.objects.bulk_create(rows)
+    return rows
+
+
+def report():
+    out = {'by_status': [], 'by_vendor': [], 'by_month': []}
+    names = {
+        FinanceSummary.DIMENSION_STATUS: 'by_status',
+        FinanceSummary.DIMENSION_VENDOR: 'by_vendor',
+        FinanceSummary.DIMENSION_MONTH: 'by_month',
+    }
+    for row in FinanceSummary.objects.exclude(request_count=0, total_amount=0).order_by('dimension', 'key'):
+        out[names[row.dimension]].append({
+            'key': row.key,
+            'count': row.request_count,
+            'total_amount': str(row.total_amount),
+        })
+    return out
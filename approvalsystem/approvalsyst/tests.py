@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings as django_settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.db.models.signals import m2m_changed
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from . import authentication, events, extraction_cache, jobs, metrics, po_documents, storage, uploads, utils
+from .models import Approval, ExtractionCache, ExtractionJob, FinanceSummary, Proforma, PurchaseOrder, PurchaseRequest, RequestItem, StoredBlob
+from .permissions import get_user_groups
+from .storage import collect_garbage
+from .summaries import SummaryDelta, compute_rows
+
+
+class TempMediaMixin:
+    """
+    Uploads and rendered files go to throwaway directories, and uploads don't
+    start extraction threads. Extra settings for the test go in media_settings.
+    """
+    media_settings = {}
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = self.make_temp_dir()
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root, CHUNKED_UPLOAD_DIR=self.make_temp_dir(), EXTRACTION_WORKERS=0,
+            **self.media_settings,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def make_temp_dir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        return path
+
+
+class QueryCountTestCase(APITestCase):
+    """
+    Pins the number of queries per endpoint. Each list is checked with a few
+    and with many rows so an N+1 shows up as a count mismatch.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = cls.make_user('staff-user', 'staff')
+        cls.finance = cls.make_user('finance-user', 'finance')
+        cls.approver1 = cls.make_user('approver-1', 'approver-level-1')
+        cls.approver2 = cls.make_user('approver-2', 'approver-level-2')
+
+    @staticmethod
+    def make_user(username, group_name):
+        user = User.objects.create_user(username, password='pass')
+        user.groups.add(Group.objects.get_or_create(name=group_name)[0])
+        return user
+
+    def setUp(self):
+        # start every request with a cold role cache
+        cache.clear()
+
+    def make_requests(self, count, status=PurchaseRequest.STATUS_PENDING, items=3):
+        requests = []
+        for n in range(count):
+            pr = PurchaseRequest.objects.create(
+                title=f'Request {n}', amount=10, status=status,
+                created_by=self.staff, required_approval_levels=[1, 2],
+            )
+            RequestItem.objects.bulk_create(
+                [RequestItem(request=pr, name=f'Item {i}', qty=1, unit_price=10) for i in range(items)]
+            )
+            requests.append(pr)
+        return requests
+
+    def as_user(self, user):
+        # a fresh instance per request, like the authentication classes produce
+        self.client.force_authenticate(User.objects.get(pk=user.pk))
+
+    def assert_list_queries(self, num, url, user, status=PurchaseRequest.STATUS_PENDING):
+        self.as_user(user)
+        self.make_requests(2, status=status)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+        cache.clear()
+        self.as_user(user)
+        self.make_requests(10, status=status)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 12)
+
+
+class RequestListQueryTests(QueryCountTestCase):
+
+    def test_list_as_staff(self):
+        # groups, etag stamp, requests, items
+        self.assert_list_queries(4, '/api/requests/', self.staff)
+
+    def test_list_as_approver(self):
+        self.assert_list_queries(4, '/api/requests/', self.approver1)
+
+    def test_pending(self):
+        self.assert_list_queries(4, '/api/requests/pending/', self.approver1)
+
+    def test_reviewed(self):
+        self.assert_list_queries(4, '/api/requests/reviewed/', self.approver1, status=PurchaseRequest.STATUS_APPROVED)
+
+    def test_finance_list(self):
+        self.assert_list_queries(4, '/api/finance/requests/', self.finance, status=PurchaseRequest.STATUS_APPROVED)
+
+
+class RequestDetailQueryTests(QueryCountTestCase):
+
+    def test_detail(self):
+        pr = self.make_requests(1)[0]
+        self.as_user(self.staff)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/requests/{pr.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class ItemUpdateTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pr = self.make_requests(1)[0]
+        self.first, self.second, self.third = self.pr.items.order_by('pk')
+        self.as_user(self.staff)
+
+    def patch_items(self, items):
+        return self.client.patch(f'/api/requests/{self.pr.pk}/', {'items': items}, format='json')
+
+    def test_diff(self):
+        response = self.patch_items([
+            {'id': self.first.pk, 'name': 'Item 0', 'qty': 1, 'unit_price': '10.00'},  # unchanged
+            {'id': self.second.pk, 'name': 'Renamed', 'qty': 3, 'unit_price': '10.00'},  # changed
+            {'name': 'Added', 'qty': 2, 'unit_price': '5.00'},  # new; the third is removed
+        ])
+        self.assertEqual(response.status_code, 200)
+        items = list(self.pr.items.order_by('pk').values_list('pk', 'name', 'qty'))
+        self.assertEqual(items[:2], [(self.first.pk, 'Item 0', 1), (self.second.pk, 'Renamed', 3)])
+        self.assertEqual(items[2][1:], ('Added', 2))
+        self.assertNotIn(self.third.pk, [pk for pk, _, _ in items])
+        self.pr.refresh_from_db()
+        self.assertEqual(self.pr.amount, 50)
+
+    def test_duplicate_and_foreign_ids_are_rejected(self):
+        other = self.make_requests(1)[0].items.first()
+        for items in (
+            [{'id': self.first.pk, 'name': 'x', 'qty': 2}, {'id': self.first.pk, 'name': 'y', 'qty': 3}],
+            [{'id': other.pk, 'name': 'x', 'qty': 1}],
+        ):
+            with self.subTest(items=items):
+                self.assertEqual(self.patch_items(items).status_code, 400)
+        self.assertEqual(self.pr.items.count(), 3)
+        self.pr.refresh_from_db()
+        self.assertEqual(self.pr.amount, 10)
+
+
+class KeysetPaginationTests(QueryCountTestCase):
+    # rows sharing a created_at are told apart by id
+
+    def tied_requests(self, count, status=PurchaseRequest.STATUS_PENDING):
+        ids = [pr.pk for pr in self.make_requests(count, status=status, items=1)]
+        now = timezone.now()
+        # two timestamps, so pages end both inside and across a tie
+        PurchaseRequest.objects.filter(pk__in=ids[:2]).update(created_at=now - timedelta(hours=1))
+        PurchaseRequest.objects.filter(pk__in=ids[2:]).update(created_at=now)
+        return sorted(ids[2:], reverse=True) + sorted(ids[:2], reverse=True)
+
+    def walk(self, url, user):
+        self.as_user(user)
+        pages, response = [], self.client.get(url)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        backwards = [pages[-1]]
+        while response.data['previous'] is not None:
+            response = self.client.get(response.data['previous'])
+            backwards.append([row['id'] for row in response.data['results']])
+        return pages, backwards[::-1]
+
+    def assert_pages(self, url, user, expected):
+        pages, backwards = self.walk(f'{url}?page_size=3', user)
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages[:-1]], [3] * (len(pages) - 1))
+        # walking back through the previous links gives the same pages
+        self.assertEqual(backwards, pages)
+
+    def test_requests(self):
+        self.assert_pages('/api/requests/', self.staff, self.tied_requests(8))
+
+    def test_pending(self):
+        self.assert_pages('/api/requests/pending/', self.approver1, self.tied_requests(7))
+
+    def test_reviewed(self):
+        self.assert_pages('/api/requests/reviewed/', self.approver1, self.tied_requests(7, status=PurchaseRequest.STATUS_APPROVED))
+
+    def test_finance(self):
+        self.assert_pages('/api/finance/requests/', self.finance, self.tied_requests(6, status=PurchaseRequest.STATUS_APPROVED))
+
+    def test_page_size_is_clamped(self):
+        self.make_requests(6, items=0)
+        self.as_user(self.staff)
+        with override_settings(MAX_PAGE_SIZE=4):
+            self.assertEqual(len(self.client.get('/api/requests/?page_size=500').data['results']), 4)
+            self.assertEqual(len(self.client.get('/api/requests/?page_size=0').data['results']), 1)
+            self.assertEqual(len(self.client.get('/api/requests/?page_size=x').data['results']), 4)
+
+    def test_bad_cursor(self):
+        self.as_user(self.staff)
+        for cursor in ('garbage', 'eHx5fHo=', 'cXwyMDI0LTAxLTAxfDE='):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/requests/?cursor={cursor}').status_code, 404)
+
+
+class ConditionalGetTests(QueryCountTestCase):
+
+    def test_detail_not_modified(self):
+        pr = self.make_requests(1)[0]
+        self.as_user(self.staff)
+        response = self.client.get(f'/api/requests/{pr.pk}/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        cache.clear()
+        self.as_user(self.staff)
+        # groups, etag stamp; nothing fetched or serialized
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/requests/{pr.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        pr.title = 'Renamed'
+        pr.save()
+        response = self.client.get(f'/api/requests/{pr.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_tracks_updates_and_deletes(self):
+        first, second = self.make_requests(2)
+        self.as_user(self.staff)
+        etag = self.client.get('/api/requests/')['ETag']
+        self.assertEqual(self.client.get('/api/requests/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # another page has its own tag
+        self.assertEqual(self.client.get('/api/requests/?page_size=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        PurchaseRequest.objects.filter(pk=first.pk).update(title='x', updated_at=timezone.now())
+        response = self.client.get('/api/requests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        second.delete()
+        self.assertEqual(self.client.get('/api/requests/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ApprovalQueryTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # steady state: the summary rows these tests move already exist
+        month = timezone.localtime().strftime('%Y-%m')
+        keys = [('status', s) for s, _ in PurchaseRequest.STATUS_CHOICES] + [('vendor', ''), ('month', month)]
+        FinanceSummary.objects.bulk_create([FinanceSummary(dimension=d, key=k) for d, k in keys], ignore_conflicts=True)
+
+    def test_approve(self):
+        pr = self.make_requests(1)[0]
+        self.as_user(self.approver1)
+        # groups, savepoint, locked read, insert approval, update request, release, items
+        with self.assertNumQueries(7):
+            response = self.client.patch(f'/api/requests/{pr.pk}/approve/', {'comment': 'ok'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_final_approve(self):
+        pr = self.make_requests(1)[0]
+        Approval.objects.create(purchase_request=pr, approver=self.approver1, level=1, action=Approval.APPROVED)
+        PurchaseRequest.objects.filter(pk=pr.pk).update(approved_levels_mask=PurchaseRequest.level_bit(1))
+        self.as_user(self.approver2)
+        # plus one summary update
+        with self.assertNumQueries(8):
+            response = self.client.patch(f'/api/requests/{pr.pk}/approve/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], PurchaseRequest.STATUS_APPROVED)
+
+    def test_reject(self):
+        pr = self.make_requests(1)[0]
+        self.as_user(self.approver1)
+        with self.assertNumQueries(8):
+            response = self.client.patch(f'/api/requests/{pr.pk}/reject/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], PurchaseRequest.STATUS_REJECTED)
+
+    def test_bulk_approve(self):
+        for count in (3, 15):
+            ids = [pr.pk for pr in self.make_requests(count)]
+            cache.clear()
+            self.as_user(self.approver1)
+            # groups, savepoint, locked read, own-approvals read, bulk insert, bulk update, release
+            with self.assertNumQueries(7):
+                response = self.client.post('/api/requests/bulk/', {'action': 'approve', 'ids': ids}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(all(result['ok'] for result in response.data['results']))
+
+    def test_bulk_reject(self):
+        ids = [pr.pk for pr in self.make_requests(5)]
+        self.as_user(self.approver1)
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/requests/bulk/', {'action': 'reject', 'ids': ids + [ids[-1] + 100]}, format='json')
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results[:5]], [PurchaseRequest.STATUS_REJECTED] * 5)
+        self.assertFalse(results[5]['ok'])
+
+    def test_bulk_ids_must_be_a_list(self):
+        requests = self.make_requests(2)
+        self.as_user(self.approver1)
+        # a string would iterate as digits and act on other requests
+        for ids in (str(requests[0].pk) + str(requests[1].pk), requests[0].pk, [], [0], ['x'], None):
+            with self.subTest(ids=ids):
+                response = self.client.post('/api/requests/bulk/', {'action': 'approve', 'ids': ids}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ids', response.data)
+        with override_settings(BULK_ACTION_MAX_IDS=1):
+            response = self.client.post('/api/requests/bulk/', {'action': 'approve', 'ids': [r.pk for r in requests]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Approval.objects.exists())
+
+    def test_bulk_form_encoded_ids(self):
+        first, second = self.make_requests(2)
+        self.as_user(self.approver1)
+        response = self.client.post('/api/requests/bulk/', {'action': 'reject', 'ids': [second.pk]}, format='multipart')
+        self.assertEqual([r['id'] for r in response.data['results']], [second.pk])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), (PurchaseRequest.STATUS_PENDING, PurchaseRequest.STATUS_REJECTED))
+
+
+class UploadQueryTests(TempMediaMixin, QueryCountTestCase):
+
+    def test_upload(self):
+        self.as_user(self.staff)
+        upload = SimpleUploadedFile('proforma.pdf', b'%PDF-1.4 test', content_type='application/pdf')
+        # groups, savepoint, blob refcount update + insert, proforma, job
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/proforma/upload/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+
+
+class ExtractionTestCase(TempMediaMixin, QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.as_user(self.staff)
+
+    def upload(self, content=b'%PDF-1.4 job'):
+        upload = SimpleUploadedFile('proforma.pdf', content, content_type='application/pdf')
+        return self.client.post('/api/proforma/upload/', {'file': upload}, format='multipart').data['id']
+
+    def run_job(self, job_id, **extract):
+        with mock.patch.object(jobs, 'extract_pdf_data', **extract):
+            jobs.run_job(job_id)
+        return self.client.get(f'/api/proforma/jobs/{job_id}/').data
+
+
+class ExtractionJobTests(ExtractionTestCase):
+
+    def test_queued_to_done(self):
+        job_id = self.upload()
+        self.assertEqual(self.client.get(f'/api/proforma/jobs/{job_id}/').data['status'], ExtractionJob.STATUS_QUEUED)
+        items = [{'name': 'Widget', 'qty': 2, 'unit_price': '4.50'}]
+        data = self.run_job(job_id, return_value={'vendor': 'Acme', 'items': items, 'total': Decimal('9.00')})
+        self.assertEqual(data['status'], ExtractionJob.STATUS_DONE)
+        self.assertEqual(data['proforma']['vendor_name'], 'Acme')
+        self.assertEqual(data['purchase_order']['vendor_name'], 'Acme')
+        pr = PurchaseRequest.objects.get(pk=data['purchase_request'])
+        self.assertEqual((pr.amount, pr.status), (Decimal('9.00'), PurchaseRequest.STATUS_PENDING))
+        self.assertEqual(json.loads(pr.po.items), items)
+
+    def test_float_total_is_stored_to_the_cent(self):
+        job_id = self.upload()
+        with mock.patch.object(SummaryDelta, 'add', autospec=True, side_effect=SummaryDelta.add) as add:
+            data = self.run_job(job_id, return_value={'vendor': 'Acme', 'items': [], 'total': 0.1 + 9.0})
+        self.assertEqual(data['status'], ExtractionJob.STATUS_DONE)
+        # the delta sees the same amount the row stores, not the float
+        self.assertEqual(add.call_args.args[1].amount, Decimal('9.10'))
+        pr = PurchaseRequest.objects.select_related('proforma', 'po').get(pk=data['purchase_request'])
+        self.assertEqual((pr.amount, pr.proforma.total_amount, pr.po.total_amount), (Decimal('9.10'),) * 3)
+        pending = FinanceSummary.objects.get(dimension=FinanceSummary.DIMENSION_STATUS, key=PurchaseRequest.STATUS_PENDING)
+        self.assertEqual(pending.total_amount, Decimal('9.10'))
+
+    def test_summary_update_is_the_last_write(self):
+        # the status rows stay locked from this UPDATE until commit; TestCase
+        # turns the job's transaction into a savepoint
+        job_id = self.upload()
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.run_job(job_id, return_value={'vendor': 'Acme', 'items': [], 'total': Decimal('9.00')})
+        sql = [q['sql'] for q in queries]
+        end = max(n for n, statement in enumerate(sql) if statement.startswith('RELEASE SAVEPOINT'))
+        last = [statement for statement in sql[:end] if not statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))][-1]
+        self.assertIn(FinanceSummary._meta.db_table, last)
+
+    def test_extraction_error_fails_the_job(self):
+        data = self.run_job(self.upload(), side_effect=RuntimeError('unreadable'))
+        self.assertEqual((data['status'], data['error']), (ExtractionJob.STATUS_FAILED, 'RuntimeError: unreadable'))
+
+    def test_error_after_extraction_fails_the_job(self):
+        # no total: the request can't be created
+        data = self.run_job(self.upload(), return_value={'vendor': 'Acme', 'items': [], 'total': None})
+        self.assertEqual(data['status'], ExtractionJob.STATUS_FAILED)
+        self.assertTrue(data['error'].startswith('IntegrityError'))
+        self.assertIsNone(data['purchase_request'])
+        self.assertFalse(PurchaseRequest.objects.exists())
+
+    def test_other_users_jobs_are_hidden(self):
+        job_id = self.upload()
+        self.as_user(self.finance)
+        self.assertEqual(self.client.get(f'/api/proforma/jobs/{job_id}/').status_code, 404)
+
+
+class ExtractionCacheTests(ExtractionTestCase):
+    result = {'vendor': 'Acme', 'items': [{'name': 'Widget', 'qty': 1, 'unit_price': '5.00'}], 'total': Decimal('5.00')}
+
+    def test_duplicate_upload_skips_extraction(self):
+        with mock.patch.object(jobs, 'extract_pdf_data', return_value=self.result) as extract:
+            first, second = self.upload(), self.upload()
+            jobs.run_job(first)
+            jobs.run_job(second)
+        self.assertEqual(extract.call_count, 1)
+        done = ExtractionJob.objects.filter(pk__in=[first, second], status=ExtractionJob.STATUS_DONE)
+        self.assertEqual(done.count(), 2)
+        self.assertEqual(ExtractionCache.objects.get().hits, 1)
+
+    def test_lookup_is_keyed_on_extractor_version(self):
+        before = extraction_cache.stats()
+        self.assertIsNone(extraction_cache.lookup('abc'))
+        extraction_cache.store('abc', self.result)
+        self.assertEqual(extraction_cache.lookup('abc')['vendor'], 'Acme')
+        with mock.patch.object(extraction_cache, 'EXTRACTOR_VERSION', extraction_cache.EXTRACTOR_VERSION + 1):
+            self.assertIsNone(extraction_cache.lookup('abc'))
+            # older versions are dropped on the next prune
+            self.assertEqual(extraction_cache.prune(), 1)
+        after = extraction_cache.stats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 2))
+
+    def test_prune_by_age_and_recency(self):
+        now = timezone.now()
+        for n, age in enumerate((200, 3, 2, 1)):
+            extraction_cache.store(f'hash-{n}', self.result)
+            ExtractionCache.objects.filter(content_hash=f'hash-{n}').update(last_used_at=now - timedelta(days=age))
+        with override_settings(EXTRACTION_CACHE_MAX_AGE_DAYS=90, EXTRACTION_CACHE_MAX_ENTRIES=2):
+            self.assertEqual(extraction_cache.prune(), 2)
+        self.assertEqual(sorted(ExtractionCache.objects.values_list('content_hash', flat=True)), ['hash-2', 'hash-3'])
+
+
+class OcrTests(SimpleTestCase):
+
+    def setUp(self):
+        # threads stand in for the spawned OCR processes so the worker can be mocked
+        pool = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(pool.shutdown)
+        patcher = mock.patch.object(utils, '_get_ocr_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ocr_calls = []
+        patcher = mock.patch.object(utils, '_ocr_page', side_effect=self.fake_ocr_page)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_ocr_page(self, path, page_index, dpi):
+        self.ocr_calls.append(page_index)
+        # later pages finish first
+        time.sleep(0.02 / (page_index + 1))
+        return f'ocr page {page_index}', 0.0, 0.0
+
+    def test_pages_keep_their_order(self):
+        self.assertEqual(utils.ocr_pages('doc.pdf', [4, 1, 2, 3]), ['ocr page 4', 'ocr page 1', 'ocr page 2', 'ocr page 3'])
+        self.assertEqual(sorted(self.ocr_calls), [1, 2, 3, 4])
+
+    def fake_pdf(self, texts):
+        pdf = mock.MagicMock()
+        pdf.__enter__.return_value = pdf
+        pdf.pages = [mock.Mock(extract_text=mock.Mock(return_value=text)) for text in texts]
+        return pdf
+
+    def test_only_pages_without_text_are_ocred(self):
+        texts = ['Vendor: Acme', None, 'Widget 2 4.50', '  ']
+        with mock.patch.object(utils.pdfplumber, 'open', return_value=self.fake_pdf(texts)):
+            self.assertEqual(utils.extract_page_texts('doc.pdf'), ['Vendor: Acme', 'ocr page 1', 'Widget 2 4.50', 'ocr page 3'])
+            self.assertEqual(sorted(self.ocr_calls), [1, 3])
+            data = utils.extract_pdf_data('doc.pdf')
+        self.assertEqual(data['vendor'], 'Acme')
+        self.assertEqual(data['items'], [{'name': 'Widget', 'qty': 2, 'unit_price': 4.5}])
+
+    def test_unreadable_text_layer_ocrs_every_page(self):
+        with mock.patch.object(utils.pdfplumber, 'open', side_effect=ValueError('broken')), \
+                mock.patch.object(utils, '_page_count', return_value=3):
+            self.assertEqual(utils.extract_page_texts('doc.pdf'), ['ocr page 0', 'ocr page 1', 'ocr page 2'])
+        self.assertEqual(sorted(self.ocr_calls), [0, 1, 2])
+
+    def test_text_layer_only_skips_ocr(self):
+        with mock.patch.object(utils.pdfplumber, 'open', return_value=self.fake_pdf(['a', 'b'])):
+            self.assertEqual(utils.extract_page_texts('doc.pdf'), ['a', 'b'])
+        self.assertEqual(self.ocr_calls, [])
+
+
+class ImportTests(QueryCountTestCase):
+
+    def test_import_csv_with_row_errors(self):
+        rows = ['title,description,required_approval_levels,items']
+        rows += [f'Request {n},,1;2,"[{{""name"": ""Pen"", ""qty"": 2, ""unit_price"": ""1.50""}}]"' for n in range(7)]
+        rows.append(',missing title,,')
+        rows.append('Bad items,,,"[{""qty"": 1}]"')
+        upload = SimpleUploadedFile('requests.csv', '\n'.join(rows).encode())
+        self.as_user(self.staff)
+        with override_settings(IMPORT_CHUNK_SIZE=3):
+            response = self.client.post('/api/requests/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['imported'], 7)
+        self.assertEqual([e['row'] for e in response.data['errors']], [9, 10])
+
+        pr = PurchaseRequest.objects.get(title='Request 0')
+        self.assertEqual(pr.amount, 3)
+        self.assertEqual(pr.items.count(), 1)
+        self.assertEqual(sorted(pr.level_requirements.values_list('level', flat=True)), [1, 2])
+
+    def test_import_ndjson(self):
+        lines = [
+            '{"title": "One", "items": [{"name": "Desk", "unit_price": "100"}]}',
+            '',
+            'not json',
+            '{"title": "Two", "required_approval_levels": [1]}',
+        ]
+        upload = SimpleUploadedFile('requests.ndjson', '\n'.join(lines).encode())
+        self.as_user(self.staff)
+        response = self.client.post('/api/requests/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertEqual(PurchaseRequest.objects.get(title='Two').required_approval_levels, [1])
+
+    def test_import_requires_staff(self):
+        upload = SimpleUploadedFile('requests.ndjson', b'{"title": "x"}')
+        self.as_user(self.approver1)
+        response = self.client.post('/api/requests/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 403)
+
+
+class ApprovalLevelValidationTests(QueryCountTestCase):
+
+    def create(self, levels, format='json'):
+        self.as_user(self.staff)
+        return self.client.post('/api/requests/', {'title': 'Levels', 'required_approval_levels': levels}, format=format)
+
+    def test_invalid_levels_are_rejected(self):
+        for levels in (['a'], 'abc', {'x': 1}, [0], [63], [1.5]):
+            with self.subTest(levels=levels):
+                response = self.create(levels)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('required_approval_levels', response.data)
+        self.assertFalse(PurchaseRequest.objects.filter(title='Levels').exists())
+
+    def test_levels_are_stored_as_ints(self):
+        response = self.create([2, 1, 2])
+        self.assertEqual(response.status_code, 201)
+        pr = PurchaseRequest.objects.get(pk=response.data['id'])
+        self.assertEqual(pr.required_approval_levels, [2, 1])
+        self.assertEqual(sorted(pr.level_requirements.values_list('level', flat=True)), [1, 2])
+
+        response = self.create('[2]', format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['required_approval_levels'], [2])
+
+    def test_model_rejects_invalid_levels(self):
+        with self.assertRaises(ValidationError):
+            PurchaseRequest.objects.create(title='x', amount=0, created_by=self.staff, required_approval_levels='abc')
+        pr = PurchaseRequest.objects.create(title='x', amount=0, created_by=self.staff, required_approval_levels=['3'])
+        self.assertEqual(pr.required_approval_levels, [3])
+        self.assertEqual(list(pr.level_requirements.values_list('level', flat=True)), [3])
+
+    def test_import_rejects_out_of_range_levels(self):
+        upload = SimpleUploadedFile('requests.ndjson', b'{"title": "Ok", "required_approval_levels": ["1"]}\n{"title": "Bad", "required_approval_levels": [70]}')
+        self.as_user(self.staff)
+        response = self.client.post('/api/requests/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(PurchaseRequest.objects.get(title='Ok').required_approval_levels, [1])
+
+
+    def test_out_of_range_approver_level_is_rejected(self):
+        pr = self.make_requests(1)[0]
+        approver = self.make_user('approver-70', 'approver-level-70')
+        self.as_user(approver)
+        for url in (f'/api/requests/{pr.pk}/approve/', f'/api/requests/{pr.pk}/reject/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.patch(url).status_code, 400)
+        response = self.client.post('/api/requests/bulk/', {'action': 'approve', 'ids': [pr.pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/requests/pending/').data['results'], [])
+        pr.refresh_from_db()
+        self.assertEqual((pr.status, pr.approved_levels_mask), (PurchaseRequest.STATUS_PENDING, 0))
+        for level in (0, 63, 70):
+            with self.assertRaises(ValueError):
+                PurchaseRequest.level_bit(level)
+
+
+class ExportTests(QueryCountTestCase):
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/finance/requests/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_queries_per_chunk(self):
+        self.make_requests(5, status=PurchaseRequest.STATUS_APPROVED)
+        self.make_requests(2)
+        self.as_user(self.finance)
+        # groups, requests (one cursor read in chunks), items for each chunk of 2
+        with override_settings(EXPORT_CHUNK_SIZE=2), self.assertNumQueries(5):
+            body = self.export()
+        lines = body.strip().splitlines()
+        self.assertTrue(lines[0].startswith('id,title,'))
+        self.assertEqual(len(lines), 6)
+
+    def test_export_ndjson_date_range(self):
+        old, new = self.make_requests(2, status=PurchaseRequest.STATUS_APPROVED)
+        PurchaseRequest.objects.filter(pk=old.pk).update(created_at='2024-01-10T12:00:00Z')
+        self.as_user(self.finance)
+        body = self.export('?type=ndjson&created_after=2024-01-01&created_before=2024-01-10')
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([r['id'] for r in records], [old.pk])
+        self.assertEqual(len(records[0]['items']), 3)
+
+    def test_export_rejects_bad_date(self):
+        self.as_user(self.finance)
+        response = self.client.get('/api/finance/requests/export/?created_after=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+
+class FinanceSummaryTests(QueryCountTestCase):
+
+    def assert_summary_exact(self):
+        expected = {(r.dimension, r.key): (r.request_count, r.total_amount) for r in compute_rows()}
+        stored = {(r.dimension, r.key): (r.request_count, r.total_amount) for r in FinanceSummary.objects.exclude(request_count=0)}
+        self.assertEqual(stored, expected)
+
+    def test_incremental_updates_match_rebuild(self):
+        FinanceSummary.objects.all().delete()
+        self.as_user(self.staff)
+        created = [
+            self.client.post('/api/requests/', {'title': f'R{n}', 'items': [{'name': 'Pen', 'qty': n + 1, 'unit_price': '2.50'}]}, format='json').data['id']
+            for n in range(4)
+        ]
+        self.client.patch(f'/api/requests/{created[0]}/', {'items': [{'name': 'Pen', 'qty': 10, 'unit_price': '2.50'}]}, format='json')
+        self.client.delete(f'/api/requests/{created[3]}/')
+
+        for approver in (self.approver1, self.approver2):
+            self.as_user(approver)
+            self.client.patch(f'/api/requests/{created[0]}/approve/', {}, format='json')
+        self.client.post('/api/requests/bulk/', {'action': 'reject', 'ids': created[1:3]}, format='json')
+        self.assert_summary_exact()
+
+        self.as_user(self.finance)
+        response = self.client.get('/api/finance/summary/')
+        self.assertEqual(response.data['by_status'], [
+            {'key': PurchaseRequest.STATUS_APPROVED, 'count': 1, 'total_amount': '25.00'},
+            {'key': PurchaseRequest.STATUS_REJECTED, 'count': 2, 'total_amount': '12.50'},
+        ])
+        self.assertEqual(response.data['by_vendor'], [{'key': '', 'count': 1, 'total_amount': '25.00'}])
+
+
+class ChunkedUploadTests(TempMediaMixin, QueryCountTestCase):
+
+    def send(self, session_id, offset, data):
+        return self.client.patch(
+            f'/api/uploads/{session_id}/', data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_resumable_proforma_upload(self):
+        body = b'%PDF-1.4 ' + bytes(range(256)) * 40
+        self.as_user(self.staff)
+        session = self.client.post('/api/uploads/', {'target': 'proforma', 'filename': 'scan.pdf', 'size': len(body)}, format='json').data
+
+        self.assertEqual(self.send(session['id'], 0, body[:4000]).data['offset'], 4000)
+        # a retried chunk at a stale offset is refused with the real offset
+        response = self.send(session['id'], 0, body[:4000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '4000')
+        # the commit is refused until every byte is in
+        self.assertEqual(self.client.post(f'/api/uploads/{session["id"]}/commit/').status_code, 409)
+
+        # resume in a "different process": the running hash is rebuilt from disk
+        uploads._hashers.clear()
+        offset = int(self.client.get(f'/api/uploads/{session["id"]}/')['Upload-Offset'])
+        self.assertEqual(self.send(session['id'], offset, body[offset:]).data['offset'], len(body))
+
+        response = self.client.post(f'/api/uploads/{session["id"]}/commit/', {'sha256': hashlib.sha256(body).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, 202)
+        proforma = Proforma.objects.get()
+        self.assertEqual(proforma.content_hash, hashlib.sha256(body).hexdigest())
+        with proforma.file.open('rb') as stored:
+            self.assertEqual(stored.read(), body)
+        self.assertEqual(os.listdir(django_settings.CHUNKED_UPLOAD_DIR), [])
+
+    def test_receipt_upload_checks_owner_and_hash(self):
+        pr = self.make_requests(1, status=PurchaseRequest.STATUS_APPROVED)[0]
+        self.as_user(self.approver1)
+        response = self.client.post('/api/uploads/', {'target': 'receipt', 'filename': 'r.pdf', 'size': 3, 'purchase_request': pr.pk}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.as_user(self.staff)
+        session = self.client.post('/api/uploads/', {'target': 'receipt', 'filename': 'r.pdf', 'size': 3, 'purchase_request': pr.pk}, format='json').data
+        self.send(session['id'], 0, b'abc')
+        response = self.client.post(f'/api/uploads/{session["id"]}/commit/', {'sha256': '0' * 64}, format='json')
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post(f'/api/uploads/{session["id"]}/commit/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        pr.refresh_from_db()
+        self.assertTrue(pr.receipt.name.endswith('.pdf'))
+
+
+class BlobStorageTests(TempMediaMixin, QueryCountTestCase):
+
+    def upload(self, name, body):
+        self.as_user(self.staff)
+        self.client.post('/api/proforma/upload/', {'file': SimpleUploadedFile(name, body)}, format='multipart')
+        return Proforma.objects.latest('pk')
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload('a.pdf', b'%PDF-1.4 same bytes')
+        second = self.upload('b.PDF', b'%PDF-1.4 same bytes')
+        other = self.upload('c.pdf', b'%PDF-1.4 other bytes')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, other.file.name)
+        digest = hashlib.sha256(b'%PDF-1.4 same bytes').hexdigest()
+        self.assertEqual(first.file.name, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        self.assertEqual(StoredBlob.objects.get(name=first.file.name).refcount, 2)
+        with second.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'%PDF-1.4 same bytes')
+
+    def test_gc_removes_only_unreferenced_blobs(self):
+        kept = self.upload('a.pdf', b'kept')
+        dropped = self.upload('b.pdf', b'dropped')
+        dropped_path = dropped.file.path
+        dropped.delete()
+
+        recounted, deleted = collect_garbage(grace_seconds=3600)
+        self.assertEqual(deleted, [])  # still inside the grace period
+
+        StoredBlob.objects.update(last_used_at=timezone.now() - timedelta(days=1))
+        recounted, deleted = collect_garbage(grace_seconds=3600)
+        self.assertEqual(deleted, [dropped.file.name])
+        self.assertFalse(os.path.exists(dropped_path))
+        self.assertTrue(os.path.exists(kept.file.path))
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+
+
+    def resave_during(self, target, body):
+        # a concurrent upload of `body`, landing right after storage.<target> returns
+        original = getattr(storage, target)
+
+        def interleaved(*args, **kwargs):
+            result = original(*args, **kwargs)
+            self.resaved = self.upload('again.pdf', body)
+            return result
+        return mock.patch.object(storage, target, interleaved)
+
+    def test_save_during_recount_keeps_its_reference(self):
+        blob = self.upload('a.pdf', b'busy')
+        blob.delete()
+        # unreferenced and past the grace period
+        StoredBlob.objects.update(refcount=0, last_used_at=timezone.now() - timedelta(days=1))
+        with self.resave_during('referenced_blob_names', b'busy'):
+            recounted, deleted = collect_garbage(grace_seconds=3600)
+        # the recount read 0 references before the save landed; it must not overwrite the increment
+        self.assertEqual((recounted, deleted), ([], []))
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+        self.assertTrue(os.path.exists(self.resaved.file.path))
+
+    def test_save_during_delete_rewrites_the_blob(self):
+        blob = self.upload('a.pdf', b'gone')
+        name = blob.file.name
+        blob.delete()
+        # unreferenced and past the grace period
+        StoredBlob.objects.update(refcount=0, last_used_at=timezone.now() - timedelta(days=1))
+        with self.resave_during('_remove', b'gone'):
+            recounted, deleted = collect_garbage(grace_seconds=3600)
+        self.assertEqual(deleted, [])
+        self.assertEqual(self.resaved.file.name, name)
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 1)
+        with self.resaved.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'gone')
+
+
+class PurchaseOrderDocumentTests(TempMediaMixin, QueryCountTestCase):
+
+    def test_batch_render(self):
+        orders = [
+            PurchaseOrder.objects.create(purchase_request=pr, vendor_name='Acme', total_amount=30, reference=f'PO-{pr.pk}')
+            for pr in self.make_requests(3, status=PurchaseRequest.STATUS_APPROVED)
+        ]
+        batch = po_documents.claim_batch(2)
+        self.assertEqual([po.pk for po in batch], [po.pk for po in orders[:2]])
+        # claimed rows are not handed out twice
+        self.assertEqual([po.pk for po in po_documents.claim_batch(10)], [orders[2].pk])
+
+        # the request items are prefetched with the batch
+        with self.assertNumQueries(3):  # blob refcount update + insert, one bulk update
+            po_documents.render_batch(batch[:1])
+
+        po = PurchaseOrder.objects.get(pk=orders[0].pk)
+        self.assertEqual(po.render_status, PurchaseOrder.RENDER_DONE)
+        self.assertIsNotNone(po.render_ms)
+        with po.po_file.open('rb') as stored:
+            pdf = stored.read()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertIn(b'PURCHASE ORDER PO-', pdf)
+        self.assertIn(b'Item 2', pdf)
+
+
+    def test_only_approved_requests_are_rendered(self):
+        pending = PurchaseOrder.objects.create(purchase_request=self.make_requests(1)[0], vendor_name='Acme')
+        self.assertEqual(po_documents.claim_batch(10), [])
+        PurchaseRequest.objects.filter(pk=pending.purchase_request_id).update(status=PurchaseRequest.STATUS_APPROVED)
+        self.assertEqual([po.pk for po in po_documents.claim_batch(10)], [pending.pk])
+
+    def test_extracted_items_fallback(self):
+        widget = {'name': 'Widget', 'qty': 2, 'unit_price': '4.50', 'total': '9.00'}
+        proforma = Proforma.objects.create(file='proformas/p.pdf', items=[widget], created_by=self.staff)
+        orders = [
+            PurchaseOrder.objects.create(purchase_request=pr, vendor_name='Acme', proforma=proforma if n == 0 else None, items=items)
+            for n, (pr, items) in enumerate(zip(
+                self.make_requests(3, status=PurchaseRequest.STATUS_APPROVED, items=0),
+                # JSON as stored now, and the Python repr older orders hold
+                ['', json.dumps([widget]), str([widget])],
+            ))
+        ]
+        po_documents.render_batch(po_documents.claim_batch(10))
+        for po in orders:
+            po.refresh_from_db()
+            with po.po_file.open('rb') as stored:
+                self.assertIn(b'Widget', stored.read())
+
+
+class InboxEventTests(QueryCountTestCase):
+
+    def published(self, callbacks):
+        channel_messages = []
+        with mock.patch.object(events.LocalBroadcaster, 'publish', lambda _, channel, message: channel_messages.append((channel, message))):
+            for callback in callbacks:
+                callback()
+        return channel_messages
+
+    def test_approve_and_reject_publish_queue_changes(self):
+        first, second = self.make_requests(2)
+        self.as_user(self.approver1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(f'/api/requests/{first.pk}/approve/', {}, format='json')
+        self.assertEqual(self.published(callbacks), [('inbox:1', {'type': 'left', 'request_id': first.pk, 'level': 1})])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(f'/api/requests/{second.pk}/reject/', {}, format='json')
+        self.assertEqual(sorted(channel for channel, _ in self.published(callbacks)), ['inbox:1', 'inbox:2'])
+
+        self.as_user(self.staff)
+        with self.captureOnCommitCallbacks() as callbacks:
+            created = self.client.post('/api/requests/', {'title': 'New', 'required_approval_levels': [2]}, format='json').data
+        self.assertEqual(self.published(callbacks), [('inbox:2', {'type': 'entered', 'request_id': created['id'], 'level': 2})])
+
+    def test_string_levels_publish_int_levels(self):
+        self.as_user(self.staff)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/requests/', {'title': 'New', 'required_approval_levels': ['1', '2']}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(self.published(callbacks), key=lambda item: item[0]),
+            [('inbox:1', {'type': 'entered', 'request_id': response.data['id'], 'level': 1}),
+             ('inbox:2', {'type': 'entered', 'request_id': response.data['id'], 'level': 2})],
+        )
+
+    def test_invalid_stored_levels_do_not_break_writes(self):
+        pr = self.make_requests(1)[0]
+        # written before levels were validated
+        PurchaseRequest.objects.filter(pk=pr.pk).update(required_approval_levels='abc')
+        self.as_user(self.staff)
+        with self.assertLogs('approvalsystem.approvalsyst.events', 'WARNING'):
+            self.assertEqual(self.client.delete(f'/api/requests/{pr.pk}/').status_code, 204)
+
+    def test_broadcaster_overflow_asks_for_resync(self):
+        async def scenario():
+            broadcaster = events.LocalBroadcaster(queue_size=2)
+            async with broadcaster.subscribe('inbox:1') as subscription:
+                for n in range(5):
+                    broadcaster.publish('inbox:1', {'type': 'entered', 'request_id': n})
+                await asyncio.sleep(0)
+                received = [await subscription.get()]
+                broadcaster.publish('inbox:1', {'type': 'left', 'request_id': 9})
+                await asyncio.sleep(0)
+                received.append(await subscription.get())
+            self.assertEqual(broadcaster.subscriber_count(), 0)
+            return received
+
+        self.assertEqual(asyncio.run(scenario()), [events.RESYNC, {'type': 'left', 'request_id': 9}])
+
+
+class InboxStreamTests(TransactionTestCase):
+    # the SSE view authenticates in a worker thread, which needs committed rows
+
+    async def test_stream_delivers_events(self):
+        user = await sync_to_async(QueryCountTestCase.make_user)('approver-sse', 'approver-level-1')
+        token = await sync_to_async(Token.objects.create)(user=user)
+        response = await self.async_client.get('/api/requests/pending/events/', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn(b'event: ready', await anext(stream))
+
+        async def publish_when_subscribed():
+            while not events.get_broadcaster().subscriber_count('inbox:1'):
+                await asyncio.sleep(0.01)
+            events.get_broadcaster().publish('inbox:1', {'type': 'entered', 'request_id': 7, 'level': 1})
+
+        publisher = asyncio.ensure_future(publish_when_subscribed())
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        await publisher
+        self.assertIn(b'event: entered', chunk)
+        await stream.aclose()
+
+    async def test_stream_requires_approver(self):
+        response = await self.async_client.get('/api/requests/pending/events/')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(READ_REPLICA_ALIAS='replica')
+class ReplicaRoutingTests(QueryCountTestCase):
+    # two SQLite test databases; rows written to "default" only show up on the
+    # replica once copied there, like a lagging replica
+    databases = {'default', 'replica'}
+
+    def replicate(self, pr):
+        User.objects.using('replica').bulk_create([User.objects.get(pk=pr.created_by_id)], ignore_conflicts=True)
+        PurchaseRequest.objects.using('replica').bulk_create([pr])
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        pr = self.make_requests(1, status=PurchaseRequest.STATUS_APPROVED)[0]
+        self.as_user(self.finance)
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get('/api/finance/requests/')
+        self.assertEqual(response.data['results'], [])
+        self.assertTrue(replica_queries.captured_queries)
+
+        self.replicate(pr)
+        response = self.client.get('/api/finance/requests/')
+        self.assertEqual([row['id'] for row in response.data['results']], [pr.pk])
+        export = b''.join(self.client.get('/api/finance/requests/export/?type=ndjson').streaming_content)
+        self.assertEqual(len(export.splitlines()), 1)
+
+        # pending stays on the primary
+        self.as_user(self.approver1)
+        pending = self.make_requests(1)[0]
+        response = self.client.get('/api/requests/pending/')
+        self.assertEqual([row['id'] for row in response.data['results']], [pending.pk])
+
+    def test_user_reads_own_writes(self):
+        self.as_user(self.staff)
+        created = self.client.post('/api/requests/', {'title': 'New', 'amount': '5'}, format='json')
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(PurchaseRequest.objects.using('replica').count(), 0)
+        # sticky: the new request is visible although the replica lacks it
+        response = self.client.get(f"/api/requests/{created.data['id']}/")
+        self.assertEqual(response.status_code, 200)
+
+        cache.clear()
+        self.as_user(self.staff)
+        self.assertEqual(self.client.get(f"/api/requests/{created.data['id']}/").status_code, 404)
+
+
+class AsyncEndpointTests(TempMediaMixin, QueryCountTestCase):
+
+    async def aget(self, url, user, **extra):
+        token = await sync_to_async(Token.objects.get_or_create)(user=user)
+        return await self.async_client.get(url, headers={'Authorization': f'Token {token[0].key}', **extra})
+
+    async def test_bodies_match_sync_endpoints(self):
+        pending = await sync_to_async(self.make_requests)(3)
+        approved = await sync_to_async(self.make_requests)(2, status=PurchaseRequest.STATUS_APPROVED)
+        cases = [
+            ('/api/requests/pending/?page_size=2', '/api/async/requests/pending/?page_size=2', self.approver1),
+            (f'/api/requests/{pending[0].pk}/', f'/api/async/requests/{pending[0].pk}/', self.staff),
+            ('/api/finance/requests/', '/api/async/finance/requests/', self.finance),
+        ]
+        for sync_url, async_url, user in cases:
+            await sync_to_async(self.as_user)(user)
+            expected = await sync_to_async(self.client.get)(sync_url)
+            response = await self.aget(async_url, user)
+            self.assertEqual(response.status_code, 200)
+            # same body; page links point back at the endpoint that was called
+            self.assertEqual(json.loads(response.content.replace(b'/api/async/', b'/api/')), json.loads(expected.content))
+
+        etag = response['ETag']
+        self.assertEqual((await self.aget('/api/async/finance/requests/', self.finance, **{'If-None-Match': etag})).status_code, 304)
+        self.assertEqual((await self.aget(f'/api/async/requests/{approved[0].pk}/', self.staff)).status_code, 200)
+
+    async def test_requires_role(self):
+        self.assertEqual((await self.async_client.get('/api/async/requests/pending/')).status_code, 401)
+        self.assertEqual((await self.aget('/api/async/requests/pending/', self.staff)).status_code, 403)
+        self.assertEqual((await self.aget('/api/async/finance/requests/', self.approver1)).status_code, 403)
+
+    async def test_upload_chunks(self):
+        token = (await sync_to_async(Token.objects.get_or_create)(user=self.staff))[0]
+        pr = (await sync_to_async(self.make_requests)(1))[0]
+        body = b'%PDF-1.4 ' + bytes(range(256)) * 12
+
+        def send(session_id, offset, data):
+            return self.async_client.patch(
+                f'/api/async/uploads/{session_id}/', data, content_type='application/octet-stream',
+                headers={'Authorization': f'Token {token.key}', 'Upload-Offset': str(offset)},
+            )
+
+        await sync_to_async(self.as_user)(self.staff)
+        session = (await sync_to_async(self.client.post)(
+            '/api/uploads/', {'target': 'receipt', 'filename': 'receipt.pdf', 'size': len(body), 'purchase_request': pr.pk}, format='json',
+        )).data
+        response = await send(session['id'], 0, body[:1000])
+        self.assertEqual(json.loads(response.content)['offset'], 1000)
+        response = await send(session['id'], 0, body[:1000])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '1000'))
+        await send(session['id'], 1000, body[1000:])
+
+        response = await sync_to_async(self.client.post)(
+            f"/api/uploads/{session['id']}/commit/", {'sha256': hashlib.sha256(body).hexdigest()}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class RoleCacheTests(QueryCountTestCase):
+
+    def cached_groups(self, user):
+        return get_user_groups(User.objects.get(pk=user.pk))
+
+    def read_during_clear(self):
+        # a request reading the user's roles while the clear is in progress
+        def reader(sender, action, **kwargs):
+            if action == 'pre_clear':
+                self.cached_groups(self.approver1)
+        m2m_changed.connect(reader, sender=User.groups.through)
+        self.addCleanup(m2m_changed.disconnect, reader, sender=User.groups.through)
+
+    def test_clear_invalidates_after_the_change(self):
+        self.assertEqual(self.cached_groups(self.approver1), ('approver-level-1',))
+        self.read_during_clear()
+        self.approver1.groups.clear()
+        self.assertEqual(self.cached_groups(self.approver1), ())
+
+    def test_reverse_clear_invalidates_members(self):
+        self.assertEqual(self.cached_groups(self.approver1), ('approver-level-1',))
+        self.read_during_clear()
+        Group.objects.get(name='approver-level-1').user_set.clear()
+        self.assertEqual(self.cached_groups(self.approver1), ())
+
+
+class TokenCacheTests(QueryCountTestCase):
+
+    def get_as(self, token):
+        return APIClient().get('/api/users/me/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_token_lookup_is_cached(self):
+        token = Token.objects.create(user=self.staff)
+        before = authentication.stats()
+        with self.assertNumQueries(2):
+            # token + user, groups
+            self.assertEqual(self.get_as(token).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_as(token).data['username'], 'staff-user')
+        after = authentication.stats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+
+    def test_revocation_is_immediate(self):
+        token = Token.objects.create(user=self.staff)
+        self.assertEqual(self.get_as(token).status_code, 200)
+        token.delete()
+        self.assertEqual(self.get_as(token).status_code, 401)
+
+        token = Token.objects.create(user=self.approver1)
+        self.assertEqual(self.get_as(token).status_code, 200)
+        self.approver1.is_active = False
+        self.approver1.save()
+        self.assertEqual(self.get_as(token).status_code, 401)
+
+
+class BenchmarkLoadTests(TempMediaMixin, TransactionTestCase):
+    # the load clients run in threads, which only see committed rows
+
+    def test_seed_run_and_cleanup(self):
+        output = os.path.join(self.make_temp_dir(), 'load.json')
+        # one client: the in-memory test database fails concurrent writers instead of waiting
+        call_command(
+            'benchmark_load', '--users', '8', '--requests', '6', '--items', '1',
+            '--clients', '1', '--operations', '30', '--output', output, stdout=io.StringIO(),
+        )
+        with open(output) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['dataset']['requests'], 6)
+        self.assertGreater(report['overall']['requests'], 0)
+        for name, result in report['endpoints'].items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(result['errors'], 0, result['statuses'])
+
+        call_command('benchmark_load', '--cleanup', stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username__startswith='load-').exists())
+        self.assertFalse(PurchaseRequest.objects.exists())
+
+
+class BenchmarkExtractionTests(TempMediaMixin, SimpleTestCase):
+
+    def test_baseline_and_compare(self):
+        baseline = os.path.join(self.make_temp_dir(), 'baseline.json')
+        args = ['benchmark_extraction', '--kinds', 'text', '--pages', '1', '--lines', '5', '--repeat', '1']
+        call_command(*args, '--output', baseline, stdout=io.StringIO())
+        with open(baseline) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['extractor_version'], utils.EXTRACTOR_VERSION)
+        [case] = report['results']
+        self.assertEqual((case['case'], case['items_found']), ('text-p1-l5', 5))
+        self.assertEqual(set(case['stages_s']), {'open', 'text', 'render', 'ocr', 'parse'})
+        self.assertEqual(case['stages_s']['ocr'], 0)
+        self.assertGreater(case['python_heap_peak_bytes'], 0)
+        self.assertGreater(case['max_rss_bytes'], case['python_heap_peak_bytes'])
+
+        out = io.StringIO()
+        call_command(*args, '--compare', baseline, '--tolerance', '1000', '--fail-on-regression', stdout=out)
+        self.assertIn('text-p1-l5', out.getvalue())
+        # every case counts as slower with a negative tolerance
+        with self.assertRaisesMessage(CommandError, '1 case(s) regressed: text-p1-l5'):
+            call_command(*args, '--compare', baseline, '--tolerance', '-1', '--fail-on-regression', stdout=io.StringIO())
+
+
+class MetricsTests(QueryCountTestCase):
+
+    def test_request_metrics(self):
+        self.make_requests(2)
+        self.as_user(self.staff)
+        self.assertEqual(self.client.get('/api/requests/').status_code, 200)
+        self.assertEqual(self.client.get('/api/requests/nope/').status_code, 404)
+
+        body = APIClient().get('/metrics').content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{route="api/requests/",method="GET",status="200",le="+Inf"}', body)
+        self.assertIn('db_queries_total{route="api/requests/"}', body)
+        self.assertIn('serializer_duration_seconds_count{route="api/requests/"}', body)
+        self.assertIn('status="404"', body)
+        for name in ('token_cache_hit_rate', 'extraction_cache_hits_total', 'inbox_event_subscribers'):
+            self.assertIn(f'\n{name} ', body)
+
+    def test_queries_are_counted_per_request(self):
+        before = metrics.QUERIES_PER_REQUEST._values.get(('api/users/me/',), [[0], 0])[1]
+        self.as_user(self.staff)
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.get('/api/users/me/')
+        after = metrics.QUERIES_PER_REQUEST._values[('api/users/me/',)][1]
+        self.assertEqual(after - before, len(queries))
+
+    def test_operation_durations(self):
+        metrics.observe('upload_chunk', 0.02)
+        self.assertIn('operation_duration_seconds_count{operation="upload_chunk",outcome="ok"}', metrics.render())
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token_required(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 403)
+        response = APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
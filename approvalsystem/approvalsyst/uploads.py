@@ -0,0 +1,245 @@
+# uploads.py
+# Resumable chunked uploads for proformas and receipts.
+#
+#   POST   /api/uploads/                  {target, filename, size[, purchase_request]} -> session
+#   GET    /api/uploads/<id>/             -> {offset, size, ...}, where to resume
+#   PATCH  /api/uploads/<id>/             raw bytes, Upload-Offset: <offset> -> {offset}
+#   POST   /api/uploads/<id>/commit/      [{sha256}] -> proforma job / updated request
+#   DELETE /api/uploads/<id>/             abort
+#
+# Chunk bodies are read off the request stream in small blocks and written to
+# a partial file, never buffered whole. The sha256 is updated as bytes arrive;
+# a process that didn't see the earlier chunks rebuilds it from the partial file.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics
+from .jobs import submit_proforma
+from .models import UploadSession
+
+READ_BLOCK = 64 * 1024
+_HASHERS_MAX = 256
+
+# session id -> (offset hashed so far, sha256 object)
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def part_path(session):
+    directory = Path(getattr(settings, 'CHUNKED_UPLOAD_DIR', Path(settings.BASE_DIR) / 'upload_parts'))
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f'{session.pk}.part'
+
+
+def _hasher_at(session, offset):
+    with _hashers_lock:
+        entry = _hashers.pop(session.pk, None)
+    if entry is not None and entry[0] == offset:
+        return entry[1]
+    # resumed on another process or after a restart: hash what is on disk
+    digest = hashlib.sha256()
+    remaining = offset
+    path = part_path(session)
+    if remaining:
+        with open(path, 'rb') as part:
+            while remaining:
+                block = part.read(min(READ_BLOCK, remaining))
+                if not block:
+                    raise UploadError("Partial upload is missing data, start a new upload.", status=409)
+                digest.update(block)
+                remaining -= len(block)
+    return digest
+
+
+def _keep_hasher(session, offset, digest):
+    with _hashers_lock:
+        _hashers[session.pk] = (offset, digest)
+        while len(_hashers) > _HASHERS_MAX:
+            _hashers.popitem(last=False)
+
+
+def _claimable(session, offset):
+    # one chunk at a time per session; a claim left by a crashed worker expires
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'CHUNKED_UPLOAD_STALE_SECONDS', 300))
+    return UploadSession.objects.filter(
+        Q(busy_since__isnull=True) | Q(busy_since__lt=stale),
+        pk=session.pk, status=UploadSession.STATUS_ACTIVE, offset=offset,
+    )
+
+
+def _claim(session, offset):
+    return _claimable(session, offset).update(busy_since=timezone.now())
+
+
+def _check_chunk(session, offset, length):
+    max_chunk = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+    if length is None or length <= 0:
+        raise UploadError("Send the chunk as the request body with a Content-Length.", status=411)
+    if length > max_chunk:
+        raise UploadError(f"Chunks can be at most {max_chunk} bytes.", status=413)
+    if offset + length > session.size:
+        raise UploadError("Chunk goes past the declared size.", offset=session.offset)
+
+
+def _claim_failed(session):
+    if session.status != UploadSession.STATUS_ACTIVE:
+        return UploadError("Upload is no longer active.", status=409, offset=session.offset)
+    return UploadError("Offset doesn't match, or another chunk is in progress.", status=409, offset=session.offset)
+
+
+def _write_part(session, offset, stream, length):
+    # file work only, no queries; returns the sha256 covering offset + length bytes
+    path = part_path(session)
+    written = 0
+    digest = _hasher_at(session, offset)
+    with open(path, 'r+b' if path.exists() else 'wb') as part:
+        # drop anything an interrupted chunk left past the confirmed offset
+        part.truncate(offset)
+        part.seek(offset)
+        while written < length:
+            block = stream.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            part.write(block)
+            digest.update(block)
+            written += len(block)
+    if written != length:
+        raise UploadError("Chunk body was shorter than Content-Length.", offset=offset)
+    return digest
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Append `length` bytes from `stream` at `offset`, which must be where the
+    upload currently ends. Returns the new offset.
+    """
+    _check_chunk(session, offset, length)
+    if not _claim(session, offset):
+        session.refresh_from_db(fields=['offset', 'status'])
+        raise _claim_failed(session)
+    start = time.perf_counter()
+    try:
+        digest = _write_part(session, offset, stream, length)
+    except BaseException:
+        UploadSession.objects.filter(pk=session.pk).update(busy_since=None)
+        metrics.observe('upload_chunk', time.perf_counter() - start, 'error')
+        raise
+    metrics.observe('upload_chunk', time.perf_counter() - start)
+
+    new_offset = offset + length
+    UploadSession.objects.filter(pk=session.pk).update(offset=new_offset, busy_since=None, updated_at=timezone.now())
+    _keep_hasher(session, new_offset, digest)
+    session.offset = new_offset
+    return new_offset
+
+
+async def awrite_chunk(session, offset, stream, length):
+    # write_chunk for async views: the file work runs in a worker thread, so
+    # the event loop keeps serving other connections meanwhile
+    _check_chunk(session, offset, length)
+    if not await _claimable(session, offset).aupdate(busy_since=timezone.now()):
+        await session.arefresh_from_db(fields=['offset', 'status'])
+        raise _claim_failed(session)
+    start = time.perf_counter()
+    try:
+        digest = await sync_to_async(_write_part, thread_sensitive=False)(session, offset, stream, length)
+    except BaseException:
+        await UploadSession.objects.filter(pk=session.pk).aupdate(busy_since=None)
+        metrics.observe('upload_chunk', time.perf_counter() - start, 'error')
+        raise
+    metrics.observe('upload_chunk', time.perf_counter() - start)
+
+    new_offset = offset + length
+    await UploadSession.objects.filter(pk=session.pk).aupdate(offset=new_offset, busy_since=None, updated_at=timezone.now())
+    _keep_hasher(session, new_offset, digest)
+    session.offset = new_offset
+    return new_offset
+
+
+def commit(session, expected_hash=None):
+    """
+    Attach a complete upload to its target. Returns the ExtractionJob for a
+    proforma, or the PurchaseRequest for a receipt.
+    """
+    if session.status != UploadSession.STATUS_ACTIVE:
+        raise UploadError("Upload is no longer active.", status=409)
+    if session.offset != session.size:
+        raise UploadError(f"Upload is incomplete ({session.offset} of {session.size} bytes).", status=409, offset=session.offset)
+    if not _claim(session, session.offset):
+        raise UploadError("A chunk is still being written.", status=409, offset=session.offset)
+
+    start = time.perf_counter()
+    try:
+        content_hash = _hasher_at(session, session.offset).hexdigest()
+        if expected_hash and expected_hash.lower() != content_hash:
+            raise UploadError("sha256 doesn't match the uploaded bytes.", status=422)
+
+        path = part_path(session)
+        result = None
+        with open(path, 'rb') as part:
+            upload = File(part, name=session.filename)
+            if session.target == UploadSession.TARGET_PROFORMA:
+                result = submit_proforma(upload, content_hash, session.created_by)
+                session.proforma_id = result.proforma_id
+            else:
+                pr = session.purchase_request
+                pr.receipt.save(session.filename, upload, save=False)
+                pr.save(update_fields=['receipt', 'updated_at'])
+                result = pr
+    except BaseException:
+        UploadSession.objects.filter(pk=session.pk).update(busy_since=None)
+        metrics.observe('upload_commit', time.perf_counter() - start, 'error')
+        raise
+    metrics.observe('upload_commit', time.perf_counter() - start)
+
+    session.status = UploadSession.STATUS_COMMITTED
+    session.content_hash = content_hash
+    session.busy_since = None
+    session.save(update_fields=['status', 'content_hash', 'proforma', 'busy_since', 'updated_at'])
+    _discard(session)
+    return result
+
+
+def abort(session):
+    session.status = UploadSession.STATUS_ABORTED
+    session.save(update_fields=['status', 'updated_at'])
+    _discard(session)
+
+
+def _discard(session):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale(older_than):
+    """
+    Abort active sessions untouched for `older_than` seconds and delete their
+    partial files. Returns how many were purged.
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    stale = list(UploadSession.objects.filter(status=UploadSession.STATUS_ACTIVE, updated_at__lt=cutoff))
+    for session in stale:
+        abort(session)
+    return len(stale)
@@ -1,6 +1,8 @@
 from rest_framework.routers import DefaultRouter
-from .views import PurchaseRequestViewSet,me, UploadProformaView, FinancePurchaseRequestViewSet
+from .views import PurchaseRequestViewSet,me, inbox_events, UploadProformaView, ExtractionJobView, FinancePurchaseRequestViewSet, FinanceSummaryView, UploadSessionCreateView, UploadSessionView, UploadSessionCommitView
 from django.urls import path, include
+from . import async_views
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'requests', PurchaseRequestViewSet, basename='purchase-request')
@@ -8,8 +10,20 @@ finance_router = DefaultRouter()
 finance_router.register(r'requests', FinancePurchaseRequestViewSet, basename='finance-requests')
 
 urlpatterns = [
+    path('api/finance/summary/', FinanceSummaryView.as_view(), name='finance-summary'),
     path('api/finance/', include(finance_router.urls)),
     path('api/proforma/upload/', UploadProformaView.as_view(), name='upload-proforma'),
+    path('api/proforma/jobs/<int:job_id>/', ExtractionJobView.as_view(), name='extraction-job'),
+    path('api/uploads/', UploadSessionCreateView.as_view(), name='upload-sessions'),
+    path('api/uploads/<uuid:session_id>/', UploadSessionView.as_view(), name='upload-session'),
+    path('api/uploads/<uuid:session_id>/commit/', UploadSessionCommitView.as_view(), name='upload-session-commit'),
+    path('api/requests/pending/events/', inbox_events, name='inbox-events'),
+    # async twins of the hot endpoints, for ASGI servers (see async_views.py)
+    path('api/async/requests/pending/', async_views.pending, name='async-pending'),
+    path('api/async/requests/<int:pk>/', async_views.request_detail, name='async-request-detail'),
+    path('api/async/finance/requests/', async_views.finance_requests, name='async-finance-requests'),
+    path('api/async/uploads/<uuid:session_id>/', async_views.upload_chunk, name='async-upload-session'),
     path('api/', include(router.urls)),
-    path('api/users/me/', me, name='user-me')
+    path('api/users/me/', me, name='user-me'),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -1,38 +1,175 @@
 # utils.py
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from itertools import repeat
+
 import pdfplumber
+import pypdfium2 as pdfium
 import pytesseract
-from pdf2image import convert_from_path
-import re
+from django.conf import settings
+
+# bump whenever extract_pdf_data's output changes so cached results are not reused
+EXTRACTOR_VERSION = 2
+
+VENDOR_RE = re.compile(r'Vendor[:\s]*(.+)', re.IGNORECASE)
+ITEM_RE = re.compile(r'(.+?)\s+(\d+)\s+([\d,\.]+)')
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def _get_ocr_pool():
+    # One pool per process shared by every extraction, so concurrent uploads
+    # can't fan out to more than OCR_MAX_WORKERS tesseract processes.
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            workers = getattr(settings, 'OCR_MAX_WORKERS', None) or os.cpu_count() or 1
+            # spawn: forking a threaded web/worker process is not safe
+            _ocr_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _ocr_pool
+
+
+def _reset_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+@contextmanager
+def _timed(timings, stage):
+    # accumulate wall time per extraction stage when the caller asks for it
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _ocr_page(path, page_index, dpi):
+    # render in-process with pdfium, one page at a time, so a worker never
+    # holds more than a single bitmap. Returns (text, render_seconds, ocr_seconds).
+    pdf = pdfium.PdfDocument(path)
+    try:
+        start = time.perf_counter()
+        image = pdf[page_index].render(scale=dpi / 72).to_pil()
+        rendered = time.perf_counter()
+        text = pytesseract.image_to_string(image)
+        return text, rendered - start, time.perf_counter() - rendered
+    except Exception as exc:
+        # some pytesseract errors can't be pickled back to the parent and
+        # would break the whole pool
+        raise RuntimeError(f"OCR failed on page {page_index + 1}: {type(exc).__name__}: {exc}") from None
+    finally:
+        pdf.close()
+
 
-def extract_pdf_data(file):
-    text = ''
+def ocr_pages(path, page_indexes, dpi=None, timings=None):
+    dpi = dpi or getattr(settings, 'OCR_DPI', 200)
+    page_indexes = list(page_indexes)
+    if len(page_indexes) == 1:
+        results = [_ocr_page(path, page_indexes[0], dpi)]
+    else:
+        try:
+            # map keeps page order; pages are spread across the pool
+            results = list(_get_ocr_pool().map(_ocr_page, repeat(path), page_indexes, repeat(dpi)))
+        except BrokenProcessPool:
+            _reset_ocr_pool()
+            raise
+    if timings is not None:
+        # summed across workers, i.e. CPU time rather than wall time
+        timings['render'] = timings.get('render', 0.0) + sum(r[1] for r in results)
+        timings['ocr'] = timings.get('ocr', 0.0) + sum(r[2] for r in results)
+    return [r[0] for r in results]
+
+
+def _page_count(path):
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+@contextmanager
+def _local_path(file):
+    # pdfium workers open the document by path; spill in-memory uploads to a temp file
+    if isinstance(file, (str, os.PathLike)):
+        yield file
+        return
+    if hasattr(file, 'temporary_file_path'):
+        yield file.temporary_file_path()
+        return
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as tmp:
+        shutil.copyfileobj(file, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def extract_page_texts(path, timings=None):
+    """
+    Text for every page: the text layer where a page has one, OCR only for the
+    pages that don't.
+    """
+    try:
+        with _timed(timings, 'open'):
+            pdf = pdfplumber.open(path)
+        with pdf, _timed(timings, 'text'):
+            page_texts = [page.extract_text() or '' for page in pdf.pages]
+    except Exception:
+        # unreadable text layer: OCR the whole document
+        page_texts = [''] * _page_count(path)
+
+    missing = [index for index, text in enumerate(page_texts) if not text.strip()]
+    if missing:
+        for index, text in zip(missing, ocr_pages(path, missing, timings=timings)):
+            page_texts[index] = text
+    return page_texts
+
+
+def hash_file(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_pdf_data(file, timings=None):
+    """
+    Pass a dict as `timings` to get per-stage seconds (open, text, render, ocr, parse).
+    """
     items = []
     vendor = None
 
-    # Extract text
-    try:
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ''
-    except:
-        pass
-
-    # OCR fallback
-    if not text.strip():
-        pages = convert_from_path(file)
-        for page in pages:
-            text += pytesseract.image_to_string(page)
-
-    # Vendor extraction
-    vendor_match = re.search(r'Vendor[:\s]*(.+)', text, re.IGNORECASE)
-    if vendor_match:
-        vendor = vendor_match.group(1).strip()
-
-    # Items extraction (basic regex)
-    lines = text.splitlines()
-    for line in lines:
-        match = re.match(r'(.+?)\s+(\d+)\s+([\d,\.]+)', line)
-        if match:
+    with _local_path(file) as path:
+        text = '\n'.join(extract_page_texts(path, timings))
+
+    with _timed(timings, 'parse'):
+        # Vendor extraction
+        vendor_match = VENDOR_RE.search(text)
+        if vendor_match:
+            vendor = vendor_match.group(1).strip()
+
+        # Items extraction (basic regex)
+        for line in text.splitlines():
+            match = ITEM_RE.match(line)
+            if not match:
+                continue
             name, qty, price = match.groups()
             items.append({
                 'name': name.strip(),
@@ -40,5 +177,5 @@ def extract_pdf_data(file):
                 'unit_price': float(price.replace(',', ''))
             })
 
-    total = sum(i['qty'] * i['unit_price'] for i in items)
+        total = sum(i['qty'] * i['unit_price'] for i in items)
     return {'vendor': vendor, 'items': items, 'total': total}
@@ -1,31 +1,128 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db import transaction
+from django.db import router, transaction
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from approvalsystem.approvalsyst.filters import PurchaseRequestFilter
-from .models import PurchaseRequest, Approval, PurchaseOrder, Proforma
-from .utils import extract_pdf_data
-from .serializers import PurchaseRequestSerializer,UserSerializer, ProformaSerializer, PurchaseOrderSerializer
+from .models import MAX_APPROVAL_LEVEL, PurchaseRequest, Approval, PurchaseOrder, Proforma, ExtractionJob, UploadSession
+from .jobs import submit_proforma
+from .importers import guess_format, import_requests, FORMATS
+from . import exporters
+from .utils import hash_file
+from .summaries import SummaryDelta, report as summary_report
+from .events import InboxChanges, get_broadcaster, inbox_channel
+from .conditional import ConditionalGetMixin
+from .db_routing import ReplicaReadMixin
+from .metrics import log_sampled
+from .serializers import BulkActionSerializer, PurchaseRequestSerializer,UserSerializer, ProformaSerializer, PurchaseOrderSerializer, ExtractionJobSerializer, UploadSessionSerializer
+from . import uploads
 from rest_framework.views import APIView
-from .permissions import IsOwnerOrReadOnly, IsApprover, IsStaff, IsFinance, user_has_role
+from .permissions import IsOwnerOrReadOnly, IsApprover, IsStaff, IsFinance, user_has_role, get_approver_level, get_user_groups
 from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.authentication import SessionAuthentication
+from .authentication import CachedTokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from asgiref.sync import sync_to_async
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def build_purchase_order(pr, user):
+    # Unsaved PO for a request that just became fully approved. None when there is
+    # no proforma or the upload already created one (pr.po is select_related by
+    # the callers, so hasattr costs no query).
+    if not pr.proforma or hasattr(pr, 'po'):
+        return None
+    return PurchaseOrder(
+        purchase_request=pr,
+        proforma=pr.proforma,
+        vendor_name=pr.proforma.vendor_name,
+        items=json.dumps(pr.proforma.items or [], default=str),
+        total_amount=pr.proforma.total_amount,
+        generated_by=user,
+        reference=f"PO-{pr.id}-{int(timezone.now().timestamp())}"
+    )
+
+
+def invalid_level_response(level):
+    # an approver-level-N group beyond what approved_levels_mask can hold
+    if not 1 <= level <= MAX_APPROVAL_LEVEL:
+        return Response(
+            {"detail": f"Approver level must be between 1 and {MAX_APPROVAL_LEVEL}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return None
 
 
-class FinancePurchaseRequestViewSet(viewsets.ReadOnlyModelViewSet):
+class FinancePurchaseRequestViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     Finance team: can view approved requests only
     """
     serializer_class = PurchaseRequestSerializer
     permission_classes = [IsAuthenticated, IsFinance]
+    replica_actions = ('list', 'retrieve', 'export')
 
     def get_queryset(self):
         # Only approved requests
-        return PurchaseRequest.objects.filter(status=PurchaseRequest.STATUS_APPROVED)
+        return approved_requests()
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Stream every approved request as ?type=csv (default) or ?type=ndjson.
+        Optional ?created_after= / ?created_before= take a date (whole day,
+        inclusive) or an ISO datetime.
+        """
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in exporters.FORMATS:
+            return Response({"detail": f"type must be one of {', '.join(exporters.FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = PurchaseRequest.objects.filter(status=PurchaseRequest.STATUS_APPROVED)
+        try:
+            created_after = _parse_bound(request.query_params.get('created_after'))
+            created_before = _parse_bound(request.query_params.get('created_before'), end_of_day=True)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if created_after:
+            queryset = queryset.filter(created_at__gte=created_after)
+        if created_before:
+            queryset = queryset.filter(created_at__lt=created_before)
+
+        # the body is generated after the view returns: pin the read database now
+        queryset = queryset.using(router.db_for_read(PurchaseRequest))
+        response = StreamingHttpResponse(exporters.stream(queryset, fmt), content_type=exporters.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="approved-requests.{fmt}"'
+        return response
+
+
+def _parse_bound(value, end_of_day=False):
+    # Datetime bounds are used as given. A plain date means its whole day, so an
+    # upper bound becomes the start of the next day (compared with <).
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is not None:
+        if end_of_day:
+            day += timedelta(days=1)
+        parsed = datetime.combine(day, time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"Invalid date: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -41,67 +138,169 @@ class UploadProformaView(APIView):
         if not file:
             return Response({'error': 'No file uploaded'}, status=400)
 
-        proforma = Proforma.objects.create(file=file, created_by=request.user)
+        # Extraction (pdfplumber / OCR) runs in the background, poll the job for the result
+        job = submit_proforma(file, hash_file(file), request.user)
 
-        # Extract key data
-        data = extract_pdf_data(file)
-        proforma.vendor_name = data.get('vendor')
-        proforma.items = data.get('items')
-        proforma.total_amount = data.get('total')
-        proforma.save()
-        
-        purchase_request = PurchaseRequest.objects.create(
-            title=f"Request from {request.user.username}",
-            description=f"Generated from proforma {file.name}",
+        return Response(ExtractionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class FinanceSummaryView(APIView):
+    """
+    Finance dashboard totals by status, vendor and month, read from the
+    precomputed FinanceSummary rows.
+    """
+    permission_classes = [IsAuthenticated, IsFinance]
+
+    def get(self, request):
+        return Response(summary_report())
+
+
+def can_attach_receipt(user, pr):
+    return pr.created_by_id == user.pk or user_has_role(user, 'finance')
+
+
+def _upload_error(exc):
+    data = {'detail': str(exc)}
+    headers = {}
+    if exc.offset is not None:
+        data['offset'] = exc.offset
+        headers['Upload-Offset'] = str(exc.offset)
+    return Response(data, status=exc.status, headers=headers)
+
+
+class UploadSessionCreateView(APIView):
+    """
+    Start a resumable upload (protocol in uploads.py).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pr = serializer.validated_data.get('purchase_request')
+        if pr is not None and not can_attach_receipt(request.user, pr):
+            return Response({"detail":"Not allowed."}, status=status.HTTP_403_FORBIDDEN)
+        session = serializer.save(created_by=request.user)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED, headers={'Upload-Offset': '0'})
+
+
+def get_upload_session(request, session_id):
+    return get_object_or_404(
+        UploadSession.objects.select_related('purchase_request', 'created_by'),
+        pk=session_id,
+        created_by=request.user,
+    )
+
+
+class UploadSessionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id):
+        session = get_upload_session(request, session_id)
+        return Response(UploadSessionSerializer(session).data, headers={'Upload-Offset': str(session.offset)})
+
+    def patch(self, request, session_id):
+        # raw chunk body; request.data is never touched so nothing is parsed or buffered
+        session = get_upload_session(request, session_id)
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.query_params.get('offset')))
+        except (TypeError, ValueError):
+            return Response({"detail": "Send the chunk's position in an Upload-Offset header."}, status=status.HTTP_400_BAD_REQUEST)
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        try:
+            offset = uploads.write_chunk(session, offset, request.stream, length)
+        except uploads.UploadError as exc:
+            return _upload_error(exc)
+        return Response({'id': session.pk, 'offset': offset, 'size': session.size}, headers={'Upload-Offset': str(offset)})
+
+    def delete(self, request, session_id):
+        session = get_upload_session(request, session_id)
+        if session.status == UploadSession.STATUS_ACTIVE:
+            uploads.abort(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCommitView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, session_id):
+        session = get_upload_session(request, session_id)
+        if session.purchase_request and not can_attach_receipt(request.user, session.purchase_request):
+            return Response({"detail":"Not allowed."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            result = uploads.commit(session, request.data.get('sha256'))
+        except uploads.UploadError as exc:
+            return _upload_error(exc)
+        if session.target == UploadSession.TARGET_PROFORMA:
+            return Response(ExtractionJobSerializer(result).data, status=status.HTTP_202_ACCEPTED)
+        return Response(PurchaseRequestSerializer(result, context={'request': request}).data, status=status.HTTP_200_OK)
+
+
+class ExtractionJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(
+            ExtractionJob.objects.select_related('proforma'),
+            pk=job_id,
             created_by=request.user,
-            status=PurchaseRequest.STATUS_PENDING,
-            amount=proforma.total_amount,
-            proforma=proforma.file 
         )
-        # Create PO automatically
-        po = PurchaseOrder.objects.create(
-            purchase_request=purchase_request,
-            proforma=proforma,
-            vendor_name=proforma.vendor_name,
-            items=proforma.items,
-            total_amount=proforma.total_amount
+        return Response(ExtractionJobSerializer(job).data)
+
+
+def visible_requests(user, qs):
+    # staff should only see their own requests unless other roles
+    if user_has_role(user, 'staff'):
+        return qs.filter(created_by=user)
+    # approvers/finance see pending or all depending
+    if user_has_role(user, 'approver'):
+       return qs
+
+    if user_has_role(user, 'finance'):
+        return qs
+
+    return qs.none()
+
+
+def pending_requests(user, qs):
+    qs = qs.filter(status=PurchaseRequest.STATUS_PENDING)
+    level = get_approver_level(user)
+    if level is not None and not 1 <= level <= MAX_APPROVAL_LEVEL:
+        return qs.none()
+    if level is not None:
+        # requests that need this level and that this level hasn't approved yet
+        qs = (
+            qs.filter(level_requirements__level=level)
+            .annotate(level_approved=F('approved_levels_mask').bitand(PurchaseRequest.level_bit(level)))
+            .filter(level_approved=0)
         )
+    return qs
+
 
-        return Response({
-            'proforma': ProformaSerializer(proforma).data,
-            'purchase_order': PurchaseOrderSerializer(po).data
-        })
+def approved_requests():
+    return PurchaseRequest.objects.filter(status=PurchaseRequest.STATUS_APPROVED).prefetch_related('items')
 
 
-class PurchaseRequestViewSet(viewsets.ModelViewSet):
-    queryset = PurchaseRequest.objects.all().select_related('created_by','last_approved_by').prefetch_related('items','approvals')
+class PurchaseRequestViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    # the serializer only needs items; approvals are not part of the payload
+    queryset = PurchaseRequest.objects.all().prefetch_related('items')
     serializer_class = PurchaseRequestSerializer
     filterset_class = PurchaseRequestFilter
     filterset_fields = ['status', 'created_by', 'last_approved_by']
+    # pending stays on the primary: approvers act on it straight away
+    replica_actions = ('list', 'retrieve', 'reviewed')
 
     def get_permissions(self):
         # apply basic permission: authenticated
-        if self.action in ['create', 'update', 'partial_update', 'submit_receipt']:
+        if self.action in ['create', 'update', 'partial_update', 'submit_receipt', 'import_requests']:
             return [IsStaff(),]
-        if self.action in ['approve', 'reject','list_pending','reviewed']:
+        if self.action in ['approve', 'reject', 'bulk_action', 'list_pending','reviewed']:
             return [IsApprover(),]
         # finance can access via web UI endpoints -> check in front end and backend as needed
         return [IsOwnerOrReadOnly(),]
 
     def get_queryset(self):
-        user = self.request.user
-        qs = super().get_queryset()
-        # staff should only see their own requests unless other roles
-        if user_has_role(user, 'staff'):
-            return qs.filter(created_by=user)
-        # approvers/finance see pending or all depending
-        if user_has_role(user, 'approver'):
-           return qs
-
-        if user_has_role(user, 'finance'):
-            return qs
-
-        return qs.none()
+        return visible_requests(self.request.user, super().get_queryset())
     
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -124,45 +323,43 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             return super().update(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            summary, inbox = SummaryDelta(), InboxChanges()
+            summary.remove(instance)
+            inbox.remove(instance)
+            instance.delete()
+            inbox.publish()
+            summary.apply()
         
     @action(detail=True, methods=['patch'], url_path='approve')
     def approve(self, request, pk=None):
         user = request.user
-        approver_level = None
-
-        approver_groups = user.groups.filter(name__startswith='approver-level-')
-        print("Approver groups found:", approver_groups)
-        if approver_groups.exists():
-           group_name = approver_groups.first().name
-           print("Using approver group:", group_name)
-           try:
-              # Extract the number (e.g., '1' from 'approver-level-1')
-              level_str = group_name.split('-')[-1]
-              approver_level = int(level_str)
-           except (IndexError, ValueError):
-             # Failed to parse the level number from the group name
-             approver_level = None
-        print("Approve called by user:", user.username)
-        # print this particular user group or role 
-        print("User groups:", user.groups.all())
+        approver_level = get_approver_level(user)
+        log_sampled(logger, 'approve', user=user.username, groups=get_user_groups(user), level=approver_level, request_id=pk)
         if approver_level is None:
             # fallback: infer from group name, or return forbidden
             return Response({"detail":"Approver level not found on user."}, status=status.HTTP_403_FORBIDDEN)
+        error = invalid_level_response(approver_level)
+        if error is not None:
+            return error
 
-        # concurrency-safe approval
+        # concurrency-safe approval: the lock covers one read and two writes,
+        # progress lives in approved_levels_mask so nothing else needs querying
         with transaction.atomic():
-            pr = PurchaseRequest.objects.select_for_update().get(pk=pk)
+            pr = (
+                PurchaseRequest.objects.select_for_update(of=('self',))
+                .select_related('proforma', 'po')
+                .get(pk=pk)
+            )
 
             if pr.status != PurchaseRequest.STATUS_PENDING:
+                # rejected requests are never pending, so this also covers "already rejected"
                 return Response({"detail":"Cannot approve a non-pending request."}, status=status.HTTP_400_BAD_REQUEST)
-            # check if there's already a rejection
-            if pr.approvals.filter(action=Approval.REJECTED).exists():
-                pr.status = PurchaseRequest.STATUS_REJECTED
-                pr.save(update_fields=['status'])
-                return Response({"detail":"Request already rejected."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # prevent same level duplicate approval by this approver
-            if Approval.objects.filter(purchase_request=pr, approver=user, level=approver_level).exists():
+
+            # prevent duplicate approval of the same level
+            if pr.has_level_approved(approver_level):
                 return Response({"detail":"You already acted on this level."}, status=status.HTTP_400_BAD_REQUEST)
 
             # create approval record
@@ -174,64 +371,53 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
                 comment=request.data.get('comment','')
             )
 
-            # mark last_approved_by
+            # mark last_approved_by and check if all required approvals completed
+            inbox = InboxChanges()
+            inbox.remove(pr)
+            pr.approved_levels_mask |= PurchaseRequest.level_bit(approver_level)
             pr.last_approved_by = user
-            pr.save(update_fields=['last_approved_by','updated_at'])
-
-            # check if all required approvals completed
-            required = pr.required_approval_levels or getattr(settings,'REQUIRED_APPROVAL_LEVELS',[1,2])
-            approved_levels = set(pr.approvals.filter(action=Approval.APPROVED).values_list('level', flat=True))
-
-            if set(required).issubset(approved_levels):
-                # finalize as approved and generate PO
+            update_fields = ['approved_levels_mask', 'last_approved_by', 'updated_at']
+            finalized = pr.is_fully_approved()
+            if finalized:
+                summary = SummaryDelta()
+                summary.remove(pr)
                 pr.status = PurchaseRequest.STATUS_APPROVED
-                pr.save(update_fields=['status'])
-
-                # Get linked Proforma instance
-                if pr.proforma:
-                    PurchaseOrder.objects.create(
-                        purchase_request=pr,
-                        proforma=pr.proforma,
-                        vendor_name=pr.proforma.vendor_name,
-                        items=pr.proforma.items,
-                        total_amount=pr.proforma.total_amount,
-                        generated_by=user,
-                        reference=f"PO-{pr.id}-{int(timezone.now().timestamp())}"
-                    )
-
-                
-                serializer = self.get_serializer(pr)
-                return Response(serializer.data, status=status.HTTP_200_OK)
-
-            serializer = self.get_serializer(pr)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+                update_fields.append('status')
+            pr.save(update_fields=update_fields)
+
+            # finalize: generate PO from the linked Proforma
+            po = build_purchase_order(pr, user) if finalized else None
+            if po is not None:
+                po.save()
+            inbox.add(pr)
+            inbox.publish()
+            if finalized:
+                summary.add(pr)
+                summary.apply()
+
+        # serialize after the lock is released
+        serializer = self.get_serializer(pr)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['patch'], url_path='reject')
     def reject(self, request, pk=None):
         user = request.user
-        approver_level = None
-        approver_groups = user.groups.filter(name__startswith='approver-level-')
-        if approver_groups.exists():
-            group_name = approver_groups.first().name
-            try:
-                # Extract the number (e.g., '1' from 'approver-level-1')
-                level_str = group_name.split('-')[-1]
-                approver_level = int(level_str)
-            except (IndexError, ValueError):
-                pass # approver_level remains None
+        approver_level = get_approver_level(user)
         if approver_level is None:
             return Response(
                 {"detail": "Approver level could not be determined. User must belong to a group like 'approver-level-1'."}, 
                 status=status.HTTP_403_FORBIDDEN
             )
+        error = invalid_level_response(approver_level)
+        if error is not None:
+            return error
         with transaction.atomic():
             pr = PurchaseRequest.objects.select_for_update().get(pk=pk)
+            # a rejection is final, so a repeated reject lands here too
             if pr.status != PurchaseRequest.STATUS_PENDING:
                 return Response({"detail":"Cannot reject a non-pending request."}, status=status.HTTP_400_BAD_REQUEST)
-            # create rejection
-            if Approval.objects.filter(purchase_request=pr, approver=user, level=approver_level, action=Approval.REJECTED).exists():
-                return Response({"detail":"You already rejected this request at your level."}, status=status.HTTP_400_BAD_REQUEST)
 
+            # create rejection
             Approval.objects.create(
                 purchase_request=pr,
                 approver=user,
@@ -240,17 +426,118 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
                 comment=request.data.get('comment','')
             )
             # set final status immutable
+            summary, inbox = SummaryDelta(), InboxChanges()
+            summary.remove(pr)
+            inbox.remove(pr)
             pr.status = PurchaseRequest.STATUS_REJECTED
             pr.save(update_fields=['status','updated_at'])
-            serializer = self.get_serializer(pr)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            summary.add(pr)
+            inbox.add(pr)
+            inbox.publish()
+            summary.apply()
+
+        serializer = self.get_serializer(pr)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_action(self, request):
+        """
+        Approve or reject many requests at once:
+        {"action": "approve" | "reject", "ids": [1, 2, ...], "comment": "..."}
+        Same rules as approve/reject, applied with set-based queries. Returns a
+        result per id.
+        """
+        user = request.user
+        params = BulkActionSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        operation, ids, comment = (params.validated_data[key] for key in ('action', 'ids', 'comment'))
+
+        approver_level = get_approver_level(user)
+        if approver_level is None:
+            return Response({"detail":"Approver level not found on user."}, status=status.HTTP_403_FORBIDDEN)
+        error = invalid_level_response(approver_level)
+        if error is not None:
+            return error
+
+        results = {pk: {"id": pk, "ok": False, "detail": "Not found."} for pk in ids}
+        now = timezone.now()
+        with transaction.atomic():
+            # Lock in primary key order. Single approve/reject lock one row, so a
+            # fixed order means no lock cycle with them or with another bulk call.
+            locked = list(
+                PurchaseRequest.objects.select_for_update(of=('self',))
+                .select_related('proforma', 'po')
+                .filter(pk__in=ids)
+                .order_by('pk')
+            )
+            # rows where this approver already has an approval/rejection at this level
+            acted = set(
+                Approval.objects.filter(purchase_request__in=ids, approver=user, level=approver_level)
+                .values_list('purchase_request_id', flat=True)
+            )
+
+            approvals, changed, purchase_orders = [], [], []
+            summary, inbox = SummaryDelta(), InboxChanges()
+            for pr in locked:
+                result = results[pr.pk]
+                if pr.status != PurchaseRequest.STATUS_PENDING:
+                    result["detail"] = f"Cannot {operation} a non-pending request."
+                    continue
+                if pr.pk in acted or (operation == 'approve' and pr.has_level_approved(approver_level)):
+                    result["detail"] = "You already acted on this level."
+                    continue
+
+                summary.remove(pr)
+                inbox.remove(pr)
+                if operation == 'approve':
+                    approvals.append(Approval(purchase_request=pr, approver=user, level=approver_level, action=Approval.APPROVED, comment=comment))
+                    pr.approved_levels_mask |= PurchaseRequest.level_bit(approver_level)
+                    pr.last_approved_by = user
+                    if pr.is_fully_approved():
+                        pr.status = PurchaseRequest.STATUS_APPROVED
+                        po = build_purchase_order(pr, user)
+                        if po is not None:
+                            purchase_orders.append(po)
+                else:
+                    approvals.append(Approval(purchase_request=pr, approver=user, level=approver_level, action=Approval.REJECTED, comment=comment))
+                    pr.status = PurchaseRequest.STATUS_REJECTED
+                pr.updated_at = now
+                summary.add(pr)
+                inbox.add(pr)
+                changed.append(pr)
+                results[pr.pk] = {"id": pr.pk, "ok": True, "status": pr.status}
+
+            Approval.objects.bulk_create(approvals)
+            PurchaseRequest.objects.bulk_update(changed, ['status', 'approved_levels_mask', 'last_approved_by', 'updated_at'])
+            PurchaseOrder.objects.bulk_create(purchase_orders)
+            inbox.publish()
+            summary.apply()
+
+        return Response({"results": [results[pk] for pk in ids]}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_requests(self, request):
+        """
+        Bulk import requests from an uploaded CSV or NDJSON file (field "file").
+        The format comes from ?type=csv|ndjson or the file extension. Rows are
+        streamed and written in chunks; the response reports per-row errors.
+        """
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"detail": "Upload a CSV or NDJSON file as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('type') or guess_format(upload.name)
+        if fmt not in FORMATS:
+            return Response({"detail": f"Unknown file type, pass ?type={'|'.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = import_requests(upload.file, fmt, request.user)
+        return Response(report, status=status.HTTP_201_CREATED if report['imported'] else status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['post'], url_path='submit-receipt')
     def submit_receipt(self, request, pk=None):
         # Staff submits a receipt file. Only allowed if status is APPROVED (or sometimes pending based on business rules)
         pr = self.get_object()
         user = request.user
-        if pr.created_by != user and not user_has_role(user, 'finance'):
+        if not can_attach_receipt(user, pr):
             return Response({"detail":"Not allowed."}, status=status.HTTP_403_FORBIDDEN)
         if 'receipt' not in request.FILES:
             return Response({"detail":"Missing receipt file."}, status=status.HTTP_400_BAD_REQUEST)
@@ -261,15 +548,10 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
     # optionally: endpoints for listing pending / reviewed
     @action(detail=False, methods=['get'], url_path='pending')
     def list_pending(self, request):
-        user = request.user
-        qs = self.get_queryset().filter(status=PurchaseRequest.STATUS_PENDING)
-
-        if user_has_role(user, 'approver'):
-            approver_groups = user.groups.filter(name__startswith='approver-level-')
-            if approver_groups.exists():
-                level = int(approver_groups.first().name.split('-')[-1])
-                qs = [pr for pr in qs if pr.required_approval_levels and level in pr.required_approval_levels]
+        qs = pending_requests(request.user, self.get_queryset())
+        return self.conditional_list(request, qs, lambda: self._list_response(qs))
 
+    def _list_response(self, qs):
         page = self.paginate_queryset(qs)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -282,12 +564,7 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
     def reviewed(self, request):
         # show APPROVED or REJECTED
         qs = self.get_queryset().filter(status__in=[PurchaseRequest.STATUS_APPROVED, PurchaseRequest.STATUS_REJECTED])
-        page = self.paginate_queryset(qs)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(qs, many=True)
-        return Response(serializer.data)
+        return self.conditional_list(request, qs, lambda: self._list_response(qs))
 
         instance = self.get_object()
         user = request.user
@@ -311,4 +588,52 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
             self.perform_update(serializer)
         
         # Return the updated instance data
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+def _authenticated_user(request):
+    # DRF's authenticators (token header or session) outside a DRF view
+    drf_request = Request(request, authenticators=[CachedTokenAuthentication(), SessionAuthentication()])
+    try:
+        user = drf_request.user
+    except AuthenticationFailed:
+        return None
+    return user if user.is_authenticated else None
+
+
+def _approver_level_for(request):
+    user = _authenticated_user(request)
+    return user, (get_approver_level(user) if user is not None else None)
+
+
+async def inbox_events(request):
+    """
+    Server-sent events for the caller's approval level: "entered" / "left"
+    when a request joins or leaves their pending list, "resync" when the
+    client fell behind and should refetch. Needs an ASGI server; the only
+    queries are the authentication ones at connect.
+    """
+    user, level = await sync_to_async(_approver_level_for)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    if level is None:
+        return JsonResponse({"detail": "Approver level not found on user."}, status=403)
+    if not 1 <= level <= MAX_APPROVAL_LEVEL:
+        return JsonResponse({"detail": f"Approver level must be between 1 and {MAX_APPROVAL_LEVEL}."}, status=400)
+    keepalive = getattr(settings, 'INBOX_EVENTS_KEEPALIVE', 20)
+
+    async def stream():
+        yield f"retry: 5000\nevent: ready\ndata: {json.dumps({'level': level})}\n\n"
+        async with get_broadcaster().subscribe(inbox_channel(level)) as subscription:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    # comment line: keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 
@@ -22,9 +23,63 @@ ALLOWED_HOSTS = []
 # define required approval levels here (or per request)
 REQUIRED_APPROVAL_LEVELS = [1, 2]  # e.g., level 1 and level 2 must approve
 
+# background proforma extraction: size of the in-process worker pool.
+# 0 leaves jobs queued for `manage.py run_extraction_worker`
+EXTRACTION_WORKERS = 2
+# scanned proformas: OCR render resolution and cap on tesseract processes (None = CPU count)
+OCR_DPI = 200
+OCR_MAX_WORKERS = None
+# extraction results cached by file content hash
+EXTRACTION_CACHE_MAX_ENTRIES = 5000
+EXTRACTION_CACHE_MAX_AGE_DAYS = 90
+
+# seconds a user's group names stay cached; changes invalidate them immediately
+# (use a shared cache backend so invalidation reaches every worker process)
+ROLE_CACHE_TTL = 300
+
+# seconds a token -> user lookup stays cached; deleting the token or saving the
+# user drops it immediately (shared cache backend needed across processes)
+TOKEN_CACHE_TTL = 60
+
+# /metrics is open unless this is set; scrapers then send `Authorization: Bearer <token>`
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+# fraction of request_create/approve/user_role events written to the log
+LOG_SAMPLE_RATE = 0.01
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {'approvalsystem.approvalsyst': {'handlers': ['console'], 'level': 'INFO'}},
+}
+
+# session reads served from the cache, written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# most requests one bulk approve/reject call may touch
+BULK_ACTION_MAX_IDS = 500
+
+# bulk import: rows written per transaction, and per-row errors kept in the report
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+# rows fetched (and items prefetched) per query when streaming exports
+EXPORT_CHUNK_SIZE = 1000
+
 # file upload limits (optional)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
 
+# approver inbox push (api/requests/pending/events/, SSE, needs ASGI)
+INBOX_BROADCASTER = 'approvalsystem.approvalsyst.events.LocalBroadcaster'
+INBOX_EVENTS_KEEPALIVE = 20  # seconds between keepalive comments
+
+# resumable uploads (api/uploads/): partial files live outside MEDIA_ROOT until committed
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'upload_parts'
+CHUNKED_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# a chunk claim older than this is treated as abandoned
+CHUNKED_UPLOAD_STALE_SECONDS = 300
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -72,6 +127,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the latency and query counts cover the whole stack
+    'approvalsystem.approvalsyst.metrics.metrics_middleware',
      'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,10 +137,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'approvalsystem.approvalsyst.db_routing.replica_stickiness_middleware',
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication', # <--- MUST BE PRESENT
+        # TokenAuthentication with the token lookup cached, see approvalsyst/authentication.py
+        'approvalsystem.approvalsyst.authentication.CachedTokenAuthentication', # <--- MUST BE PRESENT
         'rest_framework.authentication.SessionAuthentication',
         # ... other auth classes
     ],
@@ -91,9 +150,13 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
-    ]
+    ],
+    # keyset pagination on (created_at, id); clients may ask for ?page_size= up to MAX_PAGE_SIZE
+    'DEFAULT_PAGINATION_CLASS': 'approvalsystem.approvalsyst.pagination.KeysetPagination',
+    'PAGE_SIZE': 25,
     # ...
 }
+MAX_PAGE_SIZE = 100
 ROOT_URLCONF = 'approvalsystem.urls'
 
 TEMPLATES = [
@@ -117,12 +180,49 @@ WSGI_APPLICATION = 'approvalsystem.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from the environment: DB_ENGINE, DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT, and the same with DB_REPLICA_ for a read replica (unset
+# replica values fall back to the primary's). Defaults to the local SQLite file.
+def _database(prefix, fallback=None):
+    fallback = fallback or {}
+
+    def env(name, default=''):
+        return os.environ.get(f'{prefix}{name}', fallback.get(name, default))
+
+    config = {
+        'ENGINE': env('ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': env('NAME', str(BASE_DIR / 'db.sqlite3')),
+        'USER': env('USER'),
+        'PASSWORD': env('PASSWORD'),
+        'HOST': env('HOST'),
+        'PORT': env('PORT'),
+        # keep connections open across requests instead of reconnecting each time
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
-}
+    if config['ENGINE'] == 'django.db.backends.sqlite3':
+        # take the write lock when a transaction starts, so concurrent writers
+        # wait their turn instead of failing with "database is locked"
+        config['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+    elif config['ENGINE'] == 'django.db.backends.postgresql' and os.environ.get('DB_POOL_MAX_SIZE'):
+        # psycopg 3 connection pool; it replaces persistent connections
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS'] = {'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+        }}
+    return config
+
+
+_PRIMARY_ENV = ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')
+DATABASES = {'default': _database('DB_')}
+# 'replica' always exists (tests use it as a second SQLite database); reads
+# are only routed to it when DB_REPLICA_* points somewhere
+DATABASES['replica'] = _database('DB_REPLICA_', {name: DATABASES['default'][name] for name in _PRIMARY_ENV})
+READ_REPLICA_ALIAS = 'replica' if any(f'DB_REPLICA_{name}' in os.environ for name in _PRIMARY_ENV) else None
+DATABASE_ROUTERS = ['approvalsystem.approvalsyst.db_routing.ReplicaRouter']
+# seconds a user reads from the primary after their own write
+REPLICA_STICKY_SECONDS = 10
 
 
 # Password validation
@@ -161,6 +261,15 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# uploaded documents are stored once per content hash, see approvalsyst/storage.py
+STORAGES = {
+    'default': {'BACKEND': 'approvalsystem.approvalsyst.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+BLOB_STORAGE_PREFIX = 'blobs'
+# unreferenced blobs younger than this are kept (covers saves still in a transaction)
+BLOB_GC_GRACE_SECONDS = 3600
+
 # Default primary key field type
 # https://docs.djangoproFject.com/en/5.2/ref/settings/#default-auto-field
 